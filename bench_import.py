@@ -0,0 +1,52 @@
+# micropython ESP32
+# import benchmark, source vs .mpy
+
+# LICENSE=BSD
+
+# upload *.py to "/" and tools/mpybuild.py output to "/mpy"
+# usage:
+# import bench_import
+# bench_import.run() # ecp5, ecp5flash, uftpd
+# bench_import.run(("ecp5", "httpclient", "webcache"))
+# ms: import time
+# alloc: heap taken until import returns, includes compiler garbage
+#        (lower bound, gc may run during import)
+# kept: heap still used after gc.collect()
+
+import sys
+import gc
+from time import ticks_ms, ticks_diff
+
+# import name with only path in sys.path, then unload it
+# and what it imported. Returns (ms, alloc, kept)
+def measure(name, path):
+  loaded = set(sys.modules)
+  syspath = sys.path[:]
+  sys.path[:] = [path]
+  gc.collect()
+  free = gc.mem_free()
+  t = ticks_ms()
+  try:
+    mod = __import__(name)
+    ms = ticks_diff(ticks_ms(), t)
+    alloc = free - gc.mem_free()
+    gc.collect()
+    kept = free - gc.mem_free()
+    if "stop" in mod.__dict__: # uftpd server, hasattr would load ecp5flash
+      mod.stop()
+    del mod
+  finally:
+    sys.path[:] = syspath
+    for m in list(sys.modules):
+      if m not in loaded:
+        del sys.modules[m]
+  gc.collect()
+  return ms, alloc, kept
+
+def run(names=("ecp5", "ecp5flash", "uftpd"), src="", mpy="/mpy"):
+  print("%-12s %-4s %6s %8s %8s" % ("module", "", "ms", "alloc", "kept"))
+  for name in names:
+    for kind, path in (("py", src), ("mpy", mpy)):
+      ms, alloc, kept = measure(name, path)
+      print("%-12s %-4s %6d %8d %8d" % (name, kind, ms, alloc, kept))
+  print("free %d" % gc.mem_free())
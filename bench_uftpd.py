@@ -0,0 +1,77 @@
+# micropython ESP32
+# uftpd benchmark
+
+# LICENSE=BSD
+
+# usage:
+# import bench_uftpd
+# bench_uftpd.fncmp() # synthetic 3000 names
+# bench_uftpd.mkfiles("/sd/bench", 3000) # once, creates empty files
+# bench_uftpd.fncmp("/sd/bench")
+
+import uos
+from time import ticks_ms, ticks_diff
+import uftpd
+
+_patterns = ("*.bit", "img00??.bit", "*1*2*3*.gz", "*a*b*c*d*e*", "*")
+
+# previous recursive implementation, for comparison
+def fncmp_recursive(fname, pattern):
+  pi = 0
+  si = 0
+  while pi < len(pattern) and si < len(fname):
+    if (fname[si] == pattern[pi]) or (pattern[pi] == '?'):
+      si += 1
+      pi += 1
+    else:
+      if pattern[pi] == '*':  # recurse
+        if pi == len(pattern.rstrip("*?")):  # only wildcards left
+          return True
+        while si < len(fname):
+          if fncmp_recursive(fname[si:], pattern[pi + 1:]):
+            return True
+          else:
+            si += 1
+        return False
+      else:
+        return False
+  if pi == len(pattern.rstrip("*")) and si == len(fname):
+    return True
+  else:
+    return False
+
+def mkfiles(path, n=3000):
+  try:
+    uos.mkdir(path)
+  except OSError:
+    pass
+  for i in range(n):
+    with open("%s/img%04d.bit%s" % (path, i, ".gz" if i & 1 else ""), "w") as f:
+      pass
+
+def names(n=3000):
+  return ["img%04d.bit%s" % (i, ".gz" if i & 1 else "") for i in range(n)]
+
+def fncmp(path=None, n=3000):
+  if path:
+    fnames = uos.listdir(path)
+  else:
+    fnames = names(n)
+  print("%d names" % len(fnames))
+  for pattern in _patterns:
+    t = ticks_ms()
+    count_old = 0
+    for fname in fnames:
+      if fncmp_recursive(fname, pattern):
+        count_old += 1
+    ms_old = ticks_diff(ticks_ms(), t)
+    t = ticks_ms()
+    count_new = 0
+    compiled = uftpd.fncompile(pattern)
+    for fname in fnames:
+      if uftpd.fnmatch(fname, compiled):
+        count_new += 1
+    ms_new = ticks_diff(ticks_ms(), t)
+    print("%-12s %5d match recursive %5d ms, iterative %5d ms%s" %
+      (pattern, count_new, ms_old, ms_new,
+       "" if count_old == count_new else " MISMATCH %d" % count_old))
@@ -0,0 +1,140 @@
+# micropython ESP32
+# bitstream header check
+
+# LICENSE=BSD
+
+# first block of bitstream is checked before FPGA enters
+# programming mode, so file for another device, web error
+# page or undecompressed gzip is rejected at once, without
+# erasing running design and without uploading whole file.
+# usage:
+# if bitstream.ecp5(block, idcode()):
+#   prog_open()
+# after streaming, check bytes against
+# bitstream.length (xilinx) or bitstream.max_length (ecp5)
+
+from struct import unpack
+from micropython import const
+
+_HEAD = const(2048) # header bytes searched at once
+
+length = None # bitstream data length from last header, if known
+max_length = None # most bytes the device takes, if known
+
+# ECP5 uncompressed configuration size, bits
+# (sysCONFIG usage guide). IDCODE bits 15-12:
+# 1-12F/25F, 2-45F, 3-85F
+_ECP5_BITS = { 1:5420000, 2:9590000, 3:18430000 }
+
+# recognize data which is not a bitstream
+def other(head):
+  if head[0:2] == b"\x1F\x8B":
+    print("gzip data, file name should end with .gz")
+    return True
+  if head[0:1] == b"<" or head[0:5] == b"HTTP/":
+    print("text/html, not a bitstream")
+    return True
+  return False
+
+# offset of pattern in block from i, -1 if none.
+# searched in _HEAD windows, block is not copied whole
+def find(block, pattern, i=0):
+  while i < len(block):
+    p = bytes(block[i:i+_HEAD+len(pattern)-1]).find(pattern)
+    if p >= 0:
+      return i+p
+    i += _HEAD
+  return -1
+
+# lattice ECP5 ".bit":
+# [FF 00 comments 00 FF] FF.. FF BD B3 commands
+# command VERIFY_ID E2 00 00 00 idcode(4 bytes big endian)
+# no length in header, max_length is set from device size:
+# caller checks the whole stream against it.
+# Comment is searched in whole block, longer than block
+# can't be checked and is let thru
+def ecp5(block, idcode):
+  global length, max_length
+  length = None
+  max_length = None
+  head = bytes(block[:_HEAD])
+  if other(head):
+    return False
+  i = 0
+  if head[0:2] == b"\xFF\x00": # comment block
+    i = find(block, b"\x00\xFF", 2)
+    if i < 0:
+      print("ECP5 comment longer than %d bytes, not checked" % len(block))
+      return True
+    i += 2
+  bits = _ECP5_BITS.get((idcode >> 12) & 0xF)
+  if bits and idcode & 0xFFF == 0x043:
+    max_length = bits//8 + i + _HEAD # comment and preamble
+  head = bytes(block[i:i+_HEAD]) # after comment
+  p = head.find(b"\xBD\xB3")
+  if p < 0 and head == b"\xFF" * len(head) and i+len(head) == len(block):
+    print("ECP5 preamble after %d bytes, not checked" % len(block))
+    return True
+  if p < 0 or head[0:p] != b"\xFF" * p:
+    print("ECP5 preamble BDB3 not found")
+    return False
+  p = head.find(b"\xE2\x00\x00\x00", p+2)
+  if p >= 0 and p+8 <= len(head):
+    id = unpack(">I", head[p+4:p+8])[0]
+    if id != idcode:
+      print("bitstream for IDCODE 0x%08X, FPGA has 0x%08X" % (id, idcode))
+      return False
+  return True
+
+# xilinx ".bit" header (optional, ".bin" has none):
+# 00 09 0F F0 0F F0 0F F0 0F F0 00 00 01 then fields
+# key(1) length(2) value, last field "e" length(4)
+# data: FF.. AA 99 55 66 sync, IDCODE register write 30 01 80 01 idcode
+def xilinx(block, idcode):
+  global length, max_length
+  length = None
+  max_length = None
+  head = bytes(block[:_HEAD])
+  if other(head):
+    return False
+  i = 0
+  if head[0:13] == b"\x00\x09\x0F\xF0\x0F\xF0\x0F\xF0\x0F\xF0\x00\x00\x01":
+    i = 13
+    while i+5 <= len(head):
+      key = head[i]
+      if key == 0x65: # "e"
+        length = unpack(">I", head[i+1:i+5])[0]
+        i += 5
+        break
+      n = unpack(">H", head[i+1:i+3])[0]
+      if key == 0x62: # "b" part name
+        print("part %s" % head[i+3:i+2+n].decode())
+      i += 3+n
+  p = head.find(b"\xAA\x99\x55\x66", i)
+  if p < 0:
+    print("sync word AA995566 not found")
+    return False
+  p = head.find(b"\x30\x01\x80\x01", p+4)
+  if p >= 0 and p+8 <= len(head):
+    id = unpack(">I", head[p+4:p+8])[0]
+    if (id ^ idcode) & 0x0FFFFFFF: # ignore revision
+      print("bitstream for IDCODE 0x%08X, FPGA has 0x%08X" % (id, idcode))
+      return False
+  return True
+
+# cyclone raw stream has no header, only
+# reject what is recognized as something else
+def cyclone(block, idcode):
+  global length, max_length
+  length = None
+  max_length = None
+  head = bytes(block[:_HEAD])
+  if other(head):
+    return False
+  if head[0:13] == b"\x00\x09\x0F\xF0\x0F\xF0\x0F\xF0\x0F\xF0\x00\x00\x01":
+    print("xilinx bitstream")
+    return False
+  if head.find(b"\xFF\xFF\xBD\xB3") >= 0:
+    print("ECP5 bitstream")
+    return False
+  return True
@@ -0,0 +1,130 @@
+# circuitpython ESP32S2
+# JTAG benchmark
+
+# LICENSE=BSD
+
+# usage:
+# import bench_jtag
+# bench_jtag.switch() # cost of handing pins between SPI and DigitalInOut
+# bench_jtag.flash(0x200000, 64) # overwrites FLASH at this address
+# bench_jtag.flash(0x200000, 64, "blink.bit.gz") # bitstream data
+# bench_jtag.latency() # IDCODE, FLASH status, 64-byte preload
+
+from time import monotonic_ns
+import jtag
+from jtag import *
+import ecp5f
+
+def ms(t):
+  return (monotonic_ns()-t)//1000000
+
+# one pin handover, as done around each SPI transfer
+def switch(n=100):
+  bitbang_tms_on()
+  bitbang_jtag_on()
+  t = monotonic_ns()
+  for i in range(n):
+    bitbang_jtag_off()
+    spi_jtag_on()
+    spi_jtag_off()
+    bitbang_jtag_on()
+  us = (monotonic_ns()-t)//1000//n
+  bitbang_jtag_input()
+  bitbang_jtag_off()
+  bitbang_tms_off()
+  print("SPI/bitbang switch %d us" % us)
+
+# time spent polling FLASH status
+wait_ns = 0
+def timed_wait_status(delay=0.001):
+  global wait_ns
+  t = monotonic_ns()
+  flash_wait_status(delay)
+  wait_ns += monotonic_ns()-t
+
+flash_wait_status = ecp5f.flash_wait_status
+
+def erase(addr, blocks):
+  t = monotonic_ns()
+  for i in range(blocks):
+    ecp5f.flash_erase_block(addr+i*ecp5f.flash_erase_size)
+  print("erase %d x %dK: %d ms" % (blocks, ecp5f.flash_erase_size>>10, ms(t)))
+
+# before: each page written, status polled with 1 ms sleep
+def write_pages_before(data, addr):
+  for i in range(0, len(data), ecp5f.flash_write_size):
+    ecp5f.flash_write_block(data[i:i+ecp5f.flash_write_size], addr+i, 0.001)
+
+# after: pages of 0xFF skipped, status polled without sleep
+def write_pages_after(data, addr):
+  for i in range(0, len(data), ecp5f.flash_erase_size):
+    ecp5f.flash_write_pages(data[i:i+ecp5f.flash_erase_size], addr+i)
+
+# write pages at addr, before/after, then read back.
+# data from filepath (bitstream) or test pattern
+# with every 4th page 0xFF
+def flash(addr=0x200000, pages=64, filepath=None):
+  global wait_ns
+  size = pages*ecp5f.flash_write_size
+  blocks = (size+ecp5f.flash_erase_size-1)//ecp5f.flash_erase_size
+  data = bytearray(b"\xFF" * blocks*ecp5f.flash_erase_size)
+  if filepath:
+    filedata, gz = filedata_gz(filepath)
+    filedata.readinto(memoryview(data)[:size])
+    filedata.close()
+  else:
+    for i in range(size):
+      if (i//ecp5f.flash_write_size) & 3:
+        data[i] = i
+  datamv = memoryview(data)
+  ecp5f.flash_open()
+  ecp5f.flash_wait_status = timed_wait_status
+  try:
+    for name, write in (("before", write_pages_before), ("after", write_pages_after)):
+      erase(addr, blocks)
+      sessions = jtag.spi_sessions
+      wait_ns = 0
+      t = monotonic_ns()
+      write(datamv, addr)
+      elapsed = ms(t)
+      print("write %s %d pages: %d ms, %d pages/s, %d SPI sessions, %d ms status wait" %
+        (name, pages, elapsed, pages*1000//max(elapsed,1), jtag.spi_sessions-sessions, wait_ns//1000000))
+  finally:
+    ecp5f.flash_wait_status = flash_wait_status
+  for read_size in (2048, ecp5f.flash_read_size):
+    rd = bytearray(read_size)
+    verify = "OK"
+    sessions = jtag.spi_sessions
+    t = monotonic_ns()
+    for i in range(0, size, read_size):
+      ecp5f.flash_read_block(rd, addr+i)
+      if rd != data[i:i+read_size]:
+        verify = "FAIL"
+    elapsed = ms(t)
+    print("read %d bytes in %d byte blocks: %d ms, %d kB/s, %d SPI sessions, verify %s" %
+      (size, read_size, elapsed, size//max(elapsed,1), jtag.spi_sessions-sessions, verify))
+  ecp5f.flash_close()
+
+# average us per call of fn(*args)
+def us(n, fn, *args):
+  t = monotonic_ns()
+  for i in range(n):
+    fn(*args)
+  return (monotonic_ns()-t)//1000//n
+
+def preload(data):
+  sir(b"\x1C") # LSC_PRELOAD
+  sdr(data)
+
+# JTAG shifts: bitbanged vs hardware SPI above jtag.spi_shift_min
+def latency(n=20):
+  print("IDCODE %d us" % us(n, jtag.idcode))
+  ecp5f.flash_open()
+  print("FLASH status %d us" % us(n, ecp5f.flash_wait_status))
+  data = bytearray(b"\xFF" * 64)
+  spi_shift_min = jtag.spi_shift_min
+  for mode in ("bitbang", "SPI"):
+    jtag.spi_shift_min = len(data)+1 if mode == "bitbang" else 2
+    print("preload %d bytes %s: %d us" % (len(data), mode, us(n, preload, data)))
+  jtag.spi_shift_min = spi_shift_min
+  ecp5f.flash_close()
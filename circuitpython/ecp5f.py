@@ -12,13 +12,14 @@ from struct import pack, unpack
 import jtag
 from jtag import *
 
-flash_read_size = const(2048)
+flash_read_size = const(4096) # whole erase block in one SPI session
 flash_write_size = const(256)
 flash_erase_size = const(4096) # WROOM
 flash_erase_cmd = { 4096:0x20, 32768:0x52, 65536:0xD8 } # erase commands from FLASH PDF
 flash_erase_cmd = flash_erase_cmd[flash_erase_size]
 flash_req = bytearray(4)
 flash_reqmv = memoryview(flash_req)
+flash_page_ff = b"\xFF" * flash_write_size
 
 # call this before sending the flash image
 # FPGA will enter flashing mode
@@ -33,7 +34,9 @@ def flash_open():
   flash_req[1]=0x68
   sdr_idle(flash_reqmv[0:2],32,0)
 
-def flash_wait_status():
+# page program is done in less than a ms,
+# it is polled without delay
+def flash_wait_status(delay=0.001):
   retry=50
   # read_status_register = pack("<H",0x00A0) # READ STATUS REGISTER
   while retry > 0:
@@ -42,7 +45,8 @@ def flash_wait_status():
     sdr_response(flash_reqmv[0:2])
     if (flash_reqmv[1] & 0xC1) == 0:
       break
-    sleep(0.001)
+    if delay:
+      sleep(delay)
     retry -= 1
   if retry <= 0:
     print("error flash status 0x%04X & 0xC1 != 0" % (flash_reqmv[1]))
@@ -62,7 +66,7 @@ def flash_erase_block(addr=0):
   send_tms0111() # -> select DR scan
   flash_wait_status()
 
-def flash_write_block(block, addr=0):
+def flash_write_block(block, addr=0, delay=0):
   sdr(b"\x60") # SPI WRITE ENABLE
   send_tms(0) # -> capture DR
   #send_tms(0) # -> shift DR NOTE will be send during TCK glitch
@@ -78,7 +82,22 @@ def flash_write_block(block, addr=0):
   bitbang_jtag_on()
   send_int_msb1st(block[-1],1,8) # last byte -> exit 1 DR
   send_tms0111() # -> select DR scan
-  flash_wait_status()
+  flash_wait_status(delay)
+
+# FLASH takes the page when TAP leaves shift DR, that needs
+# single TCK clocks and SPI clocks whole bytes, so each page
+# is one SPI session. Pages of all 0xFF are skipped, FLASH
+# has them already after erase or compare.
+# returns number of pages written
+def flash_write_pages(block, addr=0):
+  written = 0
+  for i in range(0, len(block), flash_write_size):
+    page = block[i:i+flash_write_size]
+    if bytes(page) == flash_page_ff:
+      continue
+    flash_write_block(page, addr+i)
+    written += 1
+  return written
 
 # data is bytearray of to-be-read length
 def flash_read_block(data, addr=0):
@@ -95,7 +114,7 @@ def flash_read_block(data, addr=0):
   jtag.hwspi.readinto(data)
   spi_jtag_off()
   bitbang_jtag_on()
-  send_int_msb1st(0,1,8) # dummy read byte -> exit 1 DR
+  send_int_msb1st(0,1,1) # dummy read bit -> exit 1 DR
   send_tms0111() # -> select DR scan
 
 def flash_close():
@@ -178,13 +197,7 @@ def flash_stream(filedata, addr=0):
         progress_char = "e"
       if must & 2: # must_write:
         #print("from 0x%06X write %dK" % (write_addr, flash_erase_size>>10),end="\r")
-        block_addr = 0
-        next_block_addr = 0
-        while next_block_addr < len(file_block):
-          next_block_addr = block_addr+flash_write_size
-          flash_write_block(file_blockmv[block_addr:next_block_addr], addr=write_addr)
-          write_addr += flash_write_size
-          block_addr = next_block_addr
+        flash_write_pages(file_blockmv, addr=write_addr)
         count_write += 1
         progress_char = "w"
     if retry <= 0:
@@ -199,7 +212,7 @@ def flash(filepath, addr=0, close=True):
   if filedata:
     status=flash_stream(filedata,addr)
     # NOTE now the SD card can be released before bitstream starts
-    if close:
+    if close and status is not None: # None: FLASH not opened
       flash_close() # start the bitstream
     return status
   return False
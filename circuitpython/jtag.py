@@ -20,6 +20,21 @@ gpio_tms = board.IO38  # BLUE LED - 549ohm - 3.3V
 
 spi_freq = const(40000000) # Hz JTAG clk frequency
 hwspi=None
+# circuitpython pins can't be shared: each switch between
+# busio.SPI and DigitalInOut constructs new objects. Counted
+# for benchmark, callers should switch as few times as possible
+spi_sessions = 0
+# shorter JTAG shifts are bitbanged, pin switch costs more
+spi_shift_min = 32 # bytes
+
+# JTAG shifts LSB first, hardware SPI MSB first
+def reverse_bits(val:int):
+  r = 0
+  for i in range(8):
+    r = (r << 1) | ((val >> i) & 1)
+  return r
+
+rev = bytes([reverse_bits(i) for i in range(256)])
 
 
 def bitbang_tms_on():
@@ -58,7 +73,8 @@ def bitbang_jtag_input():
   tdo.switch_to_input(pull=None)
 
 def spi_jtag_on():
-  global hwspi
+  global hwspi, spi_sessions
+  spi_sessions += 1
   hwspi=busio.SPI(clock=gpio_tck,MOSI=gpio_tdi,MISO=gpio_tdo)
   while not hwspi.try_lock():
     pass
@@ -118,6 +134,36 @@ def send_read_buf_lsb1st(buf, last:int, w):
   if w:
     w[l-1] = byte # write last byte
 
+# TAP should be in "capture" state, buf is shifted LSB first.
+# Long buf: all bytes except last by hardware SPI with bit
+# reversed copy, last byte bitbanged to set TMS at last bit
+def shift_lsb1st(buf, last:int, w):
+  l = len(buf)
+  if l < spi_shift_min:
+    send_tms(0) # -> shift
+    send_read_buf_lsb1st(buf,last,w)
+    return
+  n = l-1
+  out = bytearray(n)
+  for i in range(n):
+    out[i] = rev[buf[i]]
+  #send_tms(0) # -> shift NOTE will be sent during TCK glitch
+  bitbang_jtag_off() # NOTE TCK glitch
+  spi_jtag_on()
+  if w:
+    response = bytearray(n)
+    hwspi.write_readinto(out,response)
+  else:
+    hwspi.write(out)
+  spi_jtag_off()
+  bitbang_jtag_on()
+  if w:
+    send_read_buf_lsb1st(memoryview(buf)[n:],last,memoryview(w)[n:])
+    for i in range(n):
+      w[i] = rev[response[i]]
+  else:
+    send_read_buf_lsb1st(memoryview(buf)[n:],last,None)
+
 def send_int_msb1st(val:int, last:int, bits:int):
   #global tck,tms,tdi,tdo
   tms.value=0
@@ -154,8 +200,7 @@ def runtest_idle(count:int, duration_ms:int):
 def sir(data):
   send_tms(1) # -> select IR scan
   send_tms(0) # -> capture IR
-  send_tms(0) # -> shift IR
-  send_read_buf_lsb1st(data,1,None) # -> exit 1 IR
+  shift_lsb1st(data,1,None) # -> exit 1 IR
   send_tms0111() # -> select DR scan
 
 # send SIR command (bytes)
@@ -165,8 +210,7 @@ def sir(data):
 def sir_idle(data, n:int, ms:int):
   send_tms(1) # -> select IR scan
   send_tms(0) # -> capture IR
-  send_tms(0) # -> shift IR
-  send_read_buf_lsb1st(data,1,None) # -> exit 1 IR
+  shift_lsb1st(data,1,None) # -> exit 1 IR
   send_tms(0) # -> pause IR
   send_tms(1) # -> exit 2 IR
   send_tms(1) # -> update IR
@@ -174,14 +218,12 @@ def sir_idle(data, n:int, ms:int):
 
 def sdr(data):
   send_tms(0) # -> capture DR
-  send_tms(0) # -> shift DR
-  send_read_buf_lsb1st(data,1,None)
+  shift_lsb1st(data,1,None) # -> exit 1 DR
   send_tms0111() # -> select DR scan
 
 def sdr_idle(data, n:int, ms:int):
   send_tms(0) # -> capture DR
-  send_tms(0) # -> shift DR
-  send_read_buf_lsb1st(data,1,None)
+  shift_lsb1st(data,1,None) # -> exit 1 DR
   send_tms(0) # -> pause DR
   send_tms(1) # -> exit 2 DR
   send_tms(1) # -> update DR
@@ -190,8 +232,7 @@ def sdr_idle(data, n:int, ms:int):
 # sdr buffer will be overwritten with response
 def sdr_response(data):
   send_tms(0) # -> capture DR
-  send_tms(0) # -> shift DR
-  send_read_buf_lsb1st(data,1,memoryview(data))
+  shift_lsb1st(data,1,memoryview(data)) # -> exit 1 DR
   send_tms0111() # -> select DR scan
 
 def check_response(response, expected, mask=0xFFFFFFFF, message=""):
@@ -0,0 +1,377 @@
+# circuitpython ESP32S2
+# USB CDC binary upload protocol
+
+# LICENSE=BSD
+
+# Bitstream upload over second USB CDC serial port
+# (data channel), no WiFi needed. "boot.py" should have:
+#   import usb_cdc
+#   usb_cdc.enable(console=True, data=True)
+# "code.py":
+#   import usbprog
+#   usbprog.serve()
+# host: tools/usbupload.py /dev/ttyACM1 prog blink.bit
+#
+# frame: A5 type len(2) seq(2) payload crc32(4)
+# integers little endian, crc32 of type..payload.
+# Host sends CMD, device ACKs it, then data flows in DATA
+# frames numbered from 0, receiver ACKs each frame in order.
+# Sender keeps up to "window" frames unacknowledged.
+# Bad or missing frame: receiver NAKs expected seq once,
+# sender goes back to it (go-back-N), or after timeout.
+# END(seq=frames sent) closes data and is ACKed too.
+# Device answers RESULT after the command is done,
+# host ACKs it. A new CMD also counts as ACK of
+# END or RESULT whose ACK was lost.
+# read: device is sender, host receiver, same frames.
+# The same file is imported by host tools/usbupload.py.
+
+from struct import pack, unpack
+from time import monotonic
+try:
+  from binascii import crc32
+except ImportError:
+  crc32 = None
+
+_SYNC = 0xA5
+CMD = 0x43 # C payload: command letter and arguments
+DATA = 0x44 # D
+END = 0x45 # E
+ACK = 0x41 # A
+NAK = 0x4E # N
+RESULT = 0x52 # R payload: 1 byte 1-OK 0-FAIL
+
+frame_size = 1024 # max DATA payload
+window = 8 # frames sent before waiting for ACK
+timeout = 0.5 # s without frame, then resend
+retries = 20 # timeouts before giving up
+pending = None # CMD frame received while waiting for ACK
+
+# software CRC-32, if binascii has none
+if crc32 is None:
+  _crc_table = []
+  for i in range(256):
+    c = i
+    for k in range(8):
+      c = (c >> 1) ^ 0xEDB88320 if c & 1 else c >> 1
+    _crc_table.append(c)
+  def crc32(data, crc=0):
+    crc ^= 0xFFFFFFFF
+    for b in data:
+      crc = _crc_table[(crc ^ b) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+def send_frame(port, type, seq=0, payload=b""):
+  head = pack("<BHH", type, len(payload), seq & 0xFFFF)
+  crc = crc32(payload, crc32(head)) & 0xFFFFFFFF
+  port.write(bytes([_SYNC]) + head + bytes(payload) + pack("<I", crc))
+
+# n bytes or None after timeout
+def read_exact(port, n):
+  data = b""
+  leave = monotonic() + timeout
+  while len(data) < n:
+    chunk = port.read(n-len(data))
+    if chunk:
+      data += chunk
+    elif monotonic() > leave:
+      return None
+  return data
+
+# returns (type, seq, payload), None on timeout
+# or (None, 0, b"") on bad frame
+def read_frame(port):
+  leave = monotonic() + timeout
+  while True:
+    sync = port.read(1)
+    if sync and sync[0] == _SYNC:
+      break
+    if monotonic() > leave:
+      return None
+  head = read_exact(port, 5)
+  if head is None:
+    return None
+  type, length, seq = unpack("<BHH", head)
+  if length > frame_size + 8:
+    return (None, 0, b"")
+  rest = read_exact(port, length+4)
+  if rest is None:
+    return (None, 0, b"")
+  payload = rest[:length]
+  if unpack("<I", rest[length:])[0] != crc32(payload, crc32(head)) & 0xFFFFFFFF:
+    return (None, 0, b"")
+  return (type, seq, payload)
+
+# receiving side: DATA frames as a stream for readinto(),
+# like a file for prog_stream() and flash_stream()
+class rx_stream:
+
+  def __init__(self, port):
+    self.port = port
+    self.seq = 0 # expected
+    self.data = b""
+    self.pos = 0
+    self.end = False
+    self.nak = False
+    self.error = None
+
+  # next DATA frame in order, False at END or error
+  def receive(self):
+    fails = 0
+    while True:
+      frame = read_frame(self.port)
+      if frame is None:
+        fails += 1
+        if fails > retries:
+          self.error = "timeout"
+          return False
+        continue
+      type, seq, payload = frame
+      if type == DATA and seq == self.seq & 0xFFFF:
+        send_frame(self.port, ACK, seq)
+        self.seq += 1
+        self.nak = False
+        self.data = payload
+        self.pos = 0
+        return True
+      if type == END and seq == self.seq & 0xFFFF:
+        send_frame(self.port, ACK, seq)
+        self.end = True
+        return False
+      if type == CMD and self.seq == 0: # ACK of CMD lost
+        send_frame(self.port, ACK, seq)
+        continue
+      if type == RESULT: # sender gave up
+        self.error = "aborted"
+        return False
+      if type == DATA and ((self.seq - seq) & 0xFFFF) < 0x8000:
+        send_frame(self.port, ACK, self.seq-1) # old frame, ACK again
+      elif not self.nak:
+        send_frame(self.port, NAK, self.seq)
+        self.nak = True
+
+  def readinto(self, buf):
+    mv = memoryview(buf)
+    n = 0
+    while n < len(buf):
+      if self.pos >= len(self.data):
+        if self.end or self.error or not self.receive():
+          break
+        continue
+      k = min(len(buf)-n, len(self.data)-self.pos)
+      mv[n:n+k] = self.data[self.pos:self.pos+k]
+      self.pos += k
+      n += k
+    return n
+
+  # consume data until END, if reader stopped early
+  def drain(self):
+    while not self.end and not self.error:
+      self.pos = len(self.data)
+      self.receive()
+
+# send frame until ACKed, returns ACK or RESULT frame,
+# None after retries. Other frames are stale, skipped
+def send_acked(port, type, seq, payload=b""):
+  global pending
+  for i in range(retries):
+    send_frame(port, type, seq, payload)
+    frame = read_frame(port)
+    while frame:
+      t = frame[0]
+      if t == ACK and frame[1] == seq & 0xFFFF:
+        return frame
+      if t == RESULT and type == END:
+        return frame
+      if type == CMD and (t == DATA or (t == NAK and frame[1] == 0)):
+        return frame # ACK lost, device already waits or sends DATA
+      if t == CMD and type != CMD: # ACK lost, host sent next command
+        pending = frame
+        return frame
+      frame = read_frame(port)
+  return None
+
+# sending side: filedata.readinto() in DATA frames,
+# then END. Returns RESULT payload received early
+# (receiver gave up) or None when all data was ACKed
+def send_stream(port, filedata):
+  buf = bytearray(frame_size)
+  sent = {} # seq: payload, not ACKed
+  base = 0 # oldest not ACKed
+  next = 0
+  eof = False
+  fails = 0
+  while True:
+    while not eof and next - base < window:
+      n = filedata.readinto(buf)
+      if not n:
+        eof = True
+        break
+      sent[next] = bytes(buf[:n])
+      send_frame(port, DATA, next, sent[next])
+      next += 1
+    if eof and base == next:
+      break
+    frame = read_frame(port)
+    if frame is None: # timeout
+      fails += 1
+      if fails > retries:
+        return b"\x00"
+      resend = base
+    elif frame[0] is None: # bad ACK, next one covers it
+      resend = None
+    else:
+      type, seq, payload = frame
+      if type == RESULT:
+        return payload
+      # seq as offset from base, 16-bit wrap
+      offset = (seq - base) & 0xFFFF
+      resend = None
+      if type == ACK and offset < next-base:
+        for i in range(base, base+offset+1):
+          del sent[i]
+        base += offset+1
+        fails = 0
+      elif type == NAK and offset < next-base:
+        for i in range(base, base+offset):
+          del sent[i]
+        base += offset
+        resend = base
+    if resend is not None:
+      for i in range(resend, next):
+        send_frame(port, DATA, i, sent[i])
+  frame = send_acked(port, END, next)
+  if frame is None:
+    return b"\x00"
+  if frame[0] == RESULT:
+    return frame[2]
+  return None
+
+# device side, reads DATA for command.
+# Command functions get stream and args, return True/False
+def prog(stream):
+  import ecp5p
+  ecp5p.prog_stream(stream, blocksize=4096)
+  return ecp5p.prog_close()
+
+def flash(stream, addr):
+  import ecp5f
+  ok = ecp5f.flash_stream(stream, addr)
+  if ok is None: # addr not aligned, FLASH not opened
+    return False
+  ecp5f.flash_close()
+  return ok
+
+# pinout as sdmount.py
+def sdraw(stream, addr):
+  import board, busio, digitalio, adafruit_sdcard
+  if addr & 0x1FF:
+    print("addr must be rounded to 512 bytes")
+    return False
+  csn = digitalio.DigitalInOut(board.IO10)
+  csn.direction = digitalio.Direction.OUTPUT
+  csn.value = 1
+  spi = busio.SPI(clock=board.IO12, MOSI=board.IO11, MISO=board.IO13)
+  sdcard = adafruit_sdcard.SDCard(spi, csn)
+  block = bytearray(4096)
+  mv = memoryview(block)
+  while True:
+    k = stream.readinto(block)
+    if not k:
+      break
+    n = (k+0x1FF) & ~0x1FF
+    block[k:n] = bytes(n-k)
+    sdcard.writeblocks(addr//0x200, mv[:n])
+    addr += n
+  spi.deinit()
+  csn.deinit()
+  return True
+
+# FLASH content for read command
+class flash_reader:
+
+  def __init__(self, addr, length):
+    import ecp5f
+    self.ecp5f = ecp5f
+    self.addr = addr
+    self.remain = length
+    ecp5f.flash_open()
+
+  def readinto(self, buf):
+    n = min(len(buf), self.remain)
+    if n:
+      self.ecp5f.flash_read_block(memoryview(buf)[:n], self.addr)
+      self.addr += n
+      self.remain -= n
+    return n
+
+  def close(self):
+    self.ecp5f.flash_close()
+
+def read(addr, length):
+  return flash_reader(addr, length)
+
+# "P" prog, "F" addr flash, "S" addr sdraw, "R" addr len read
+commands = { "P":prog, "F":flash, "S":sdraw, "R":read }
+
+# one command from host, returns False on timeout
+def serve_one(port, target):
+  global pending
+  frame = pending or read_frame(port)
+  pending = None
+  if frame is None:
+    return False
+  type, seq, payload = frame
+  if type == END: # ACK was lost
+    send_frame(port, ACK, seq)
+  if type != CMD:
+    return True
+  send_frame(port, ACK, seq)
+  cmd = chr(payload[0])
+  args = ()
+  if len(payload) > 1:
+    args = unpack("<%dI" % ((len(payload)-1)//4), payload[1:])
+  ok = False
+  if cmd == "R" and cmd in target:
+    source = None
+    try:
+      source = target["R"](*args)
+      if send_stream(port, source) is not None:
+        print("transfer failed")
+    except Exception as e:
+      print(e)
+      send_acked(port, RESULT, 0, b"\x00") # host stops receiving
+    finally:
+      if source:
+        source.close()
+    return True
+  stream = rx_stream(port)
+  if cmd in target:
+    try:
+      ok = target[cmd](stream, *args)
+    except Exception as e:
+      print(e)
+      ok = False
+  else:
+    print("unknown command %s" % cmd)
+  if stream.error:
+    print("transfer %s" % stream.error)
+    ok = False
+  else:
+    stream.drain()
+  send_acked(port, RESULT, 0, b"\x01" if ok else b"\x00")
+  return True
+
+# target: command functions, default FPGA, FLASH, SD
+def serve(port=None, target=None):
+  if port is None:
+    import usb_cdc
+    port = usb_cdc.data
+    if port is None:
+      print("usb_cdc data channel disabled, see boot.py")
+      return
+    port.timeout = 0.05
+  if target is None:
+    target = commands
+  while True:
+    serve_one(port, target)
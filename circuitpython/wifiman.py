@@ -1,4 +1,9 @@
 import wifi,time
+from binascii import hexlify, unhexlify
+
+# last successful network, tried first without scan
+last_file = "wifiman.last"
+connect_ms = None # time to IP of last get_connection()
 
 def read_profiles():
   with open("wifiman.conf") as f:
@@ -9,15 +14,38 @@ def read_profiles():
     profiles[ssid] = password
   return profiles
 
+def read_last():
+  try:
+    with open(last_file) as f:
+      ssid, bssid, channel = f.read().strip("\n").rsplit(":", 2)
+    return ssid, unhexlify(bssid), int(channel)
+  except (OSError, ValueError):
+    return None
+
+def write_last(net):
+  try:
+    with open(last_file, "w") as f:
+      f.write("%s:%s:%d\n" % (net.ssid, hexlify(net.bssid).decode(), net.channel))
+  except OSError as e:
+    print("exception", str(e)) # read-only when USB drive mounted
+
 # TODO retry connection 100x
-def do_connect(ssid, password):
+def do_connect(ssid, password, channel=0, bssid=None):
   if wifi.radio.ipv4_address:
     return True
-  wifi.radio.connect(ssid,password)
+  try:
+    wifi.radio.connect(ssid,password,channel=channel,bssid=bssid)
+  except ConnectionError as e:
+    print(ssid, e)
   if wifi.radio.ipv4_address:
     return True
   return False
 
+def connected_in(start):
+  global connect_ms
+  connect_ms = int((time.monotonic()-start)*1000)
+  print("IP %s in %d ms" % (wifi.radio.ipv4_address, connect_ms))
+
 def get_connection():
   """return a working WLAN(STA_IF) instance or None"""
 
@@ -25,16 +53,21 @@ def get_connection():
   if(wifi.radio.ipv4_address):
     return
 
+  start = time.monotonic()
   connected = False
   try:
-    # ESP connecting to WiFi takes time, wait a bit and try again:
-    time.sleep(3)
-    if(wifi.radio.ipv4_address):
-      return
-
     # Read known network profiles from file
     profiles = read_profiles()
 
+    # last network directly on its channel, scan only if it fails
+    last = read_last()
+    if last and last[0] in profiles:
+      ssid, bssid, channel = last
+      print("trying",ssid,"channel",channel,"(last)")
+      if do_connect(ssid, profiles[ssid], channel, bssid):
+        connected_in(start)
+        return
+
     # Search WiFis in range
     networks = []
     for net in wifi.radio.start_scanning_networks():
@@ -48,6 +81,8 @@ def get_connection():
         password = profiles[net.ssid]
         connected = do_connect(net.ssid, password)
       if connected:
+        write_last(net)
+        connected_in(start)
         break
 
   except OSError as e:
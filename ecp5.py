@@ -12,6 +12,7 @@ from micropython import const
 from struct import unpack
 from uctypes import addressof
 from gc import collect
+import uos
 
 # FJC-ESP32-V0r2 pluggable
 #gpio_tms = const(4)
@@ -39,17 +40,22 @@ spi_freq = const(25000000) # Hz JTAG clk frequency
 # -1 for JTAG over SOFT SPI slow, compatibility
 #  1 or 2 for JTAG over HARD SPI fast
 #  2 is preferred as it has default pinout wired
-flash_read_size = const(2048)
-flash_write_size = const(256)
-flash_erase_size = const(4096)
-flash_erase_cmd = { 4096:0x20, 32768:0x52, 65536:0xD8, 262144:0xD8 } # erase commands from FLASH PDF
-flash_era = bytearray([flash_erase_cmd[flash_erase_size],0,0])
 #rb=bytearray(256) # reverse bits
 #init_reverse_bits()
 spi_channel = const(2) # -1 soft, 1:sd, 2:jtag
-flash_req=bytearray(4)
-read_status=bytearray([5])
-status=bytearray(1)
+web_cache = False # True: keep web files in local cache, see webcache.py
+prog_skip = False # True: prog() returns at once if FPGA runs the same bitstream
+prog_state = "/prog_state" # file remembering the last loaded bitstream
+loaded_usercode = 0
+loaded_id = None # None: unknown, "": not remembered
+hold = False # True: session keeps JTAG open between operations
+flash_mode = False # FPGA is in SPI FLASH access mode
+
+# FLASH functions (flash, flashrd, verify, session, run...)
+# are in ecp5flash.py, imported here on their first use
+def __getattr__(name):
+  import ecp5flash
+  return getattr(ecp5flash, name)
 
 def bitbang_jtag_on():
   global tck,tms,tdi,tdo,led
@@ -275,8 +281,20 @@ def idcode():
   bitbang_jtag_off()
   return unpack("<I", id_bytes)[0]
 
+# returns (USERCODE, DONE), TAP in "select DR scan" state
+def read_usercode_status():
+  sir_idle(b"\xC0",2,1) # read usercode
+  usercode = bytearray(4)
+  sdr_response(usercode)
+  sir_idle(b"\x3C",2,1) # LSC_READ_STATUS
+  status = bytearray(4)
+  sdr_response(status)
+  done = (unpack("<I",status)[0] & 0x2100) == 0x100
+  return unpack("<I",usercode)[0], done
+
 # common JTAG open for both program and flash
 def common_open():
+  forget() # SRAM will be erased
   spi_jtag_on()
   hwspi.init(sck=Pin(gpio_tcknc)) # avoid TCK-glitch
   bitbang_jtag_on()
@@ -304,6 +322,8 @@ def common_open():
 # FPGA will enter programming mode
 # after this TAP will be in "shift DR" state
 def prog_open():
+  global flash_mode
+  flash_mode = False
   common_open()
   sir(b"\x46") # LSC_INIT_ADDRESS
   sdr_idle(b"\x01",2,10)
@@ -334,6 +354,7 @@ def prog_stream_done():
 # this will exit FPGA programming mode and start the bitstream
 # returns status True-OK False-Fail
 def prog_close():
+  global loaded_usercode
   bitbang_jtag_on()
   send_tms(1) # -> exit 1 DR
   send_tms(0) # -> pause DR
@@ -345,7 +366,8 @@ def prog_close():
   sir_idle(b"\xC0",2,1) # read usercode
   usercode = bytearray(4)
   sdr_response(usercode)
-  check_response(unpack("<I",usercode)[0],expected=0,message="FAIL usercode")
+  loaded_usercode = unpack("<I",usercode)[0] # prog_running() compares it
+  check_response(loaded_usercode,expected=0,message="FAIL usercode")
   sir_idle(b"\x26",2,200) # ISC DISABLE
   sir_idle(b"\xFF",2,1) # BYPASS
   sir(b"\x3C") # LSC_READ_STATUS
@@ -361,107 +383,6 @@ def prog_close():
   bitbang_jtag_off()
   return done
 
-# call this before sending the flash image
-# FPGA will enter flashing mode
-# TAP should be in "select DR scan" state
-@micropython.viper
-def flash_open():
-  common_open()
-  reset_tap()
-  runtest_idle(1,0)
-  sir_idle(b"\xFF",32,0) # BYPASS
-  sir(b"\x3A") # LSC_PROG_SPI
-  sdr_idle(b"\xFE\x68",32,0)
-  # ---------- flashing begin -----------
-  # sdr("\x60") and other SPI FLASH commands
-  # here are bitreverse() values of FLASH commands
-  # found in datasheet. e.g.
-  # \x1B -> 0xD8
-  # \x60 -> 0x06 ...
-
-@micropython.viper
-def flash_wait_status(n:int):
-  retry=n
-  mask=1 # WIP bit (work-in-progress)
-  send_tms(0) # -> capture DR
-  send_tms(0) # -> shift DR
-  swspi.write(read_status) # READ STATUS REGISTER
-  swspi.readinto(status)
-  while retry > 0:
-    swspi.readinto(status)
-    if (int(status[0]) & mask) == 0:
-      break
-    sleep_ms(1)
-    retry -= 1
-  send_tms(1) # -> exit 1 DR # exit at byte incomplete
-  #send_int_msb1st(0,1,8) # exit at byte complete
-  send_tms0111() # -> select DR scan
-  if retry <= 0:
-    print("error %d flash status 0x%02X & 0x%02X != 0" % (n,status[0],mask))
-
-@micropython.viper
-def flash_erase_block(addr:int):
-  sdr(b"\x60") # SPI WRITE ENABLE
-  flash_wait_status(1001)
-  p8=ptr8(addressof(flash_era))
-  p8[1]=addr>>16
-  p8[2]=addr>>8
-  send_tms(0) # -> capture DR
-  send_tms(0) # -> shift DR
-  swspi.write(flash_era) # except LSB
-  send_int_msb1st(addr,1,8) # last LSB byte -> exit 1 DR
-  send_tms0111() # -> select DR scan
-  flash_wait_status(2002)
-
-@micropython.viper
-def flash_write_block(block, last:int, addr:int):
-  sdr(b"\x60") # SPI WRITE ENABLE
-  flash_wait_status(1003)
-  p8=ptr8(addressof(flash_req))
-  p8[0]=2
-  p8[1]=addr>>16
-  p8[2]=addr>>8
-  p8[3]=addr
-  send_tms(0) # -> capture DR
-  send_tms(0) # -> shift DR
-  swspi.write(flash_req)
-  swspi.write(block) # whole block
-  send_int_msb1st(last,1,8) # last byte -> exit 1 DR
-  send_tms0111() # -> select DR scan
-  flash_wait_status(1004)
-
-# data is bytearray of to-be-read length
-@micropython.viper
-def flash_read_block(data, addr:int):
-  p8=ptr8(addressof(flash_req))
-  p8[0]=3
-  p8[1]=addr>>16
-  p8[2]=addr>>8
-  p8[3]=addr
-  send_tms(0) # -> capture DR
-  send_tms(0) # -> shift DR
-  swspi.write(flash_req) # send SPI FLASH read command and address and dummy byte
-  swspi.readinto(data) # retrieve whole block
-  send_int_msb1st(0,1,8) # dummy read byte -> exit 1 DR
-  send_tms0111() # -> select DR scan
-
-# call this after uploading all of the flash blocks,
-# this will exit FPGA flashing mode and start the bitstream
-@micropython.viper
-def flash_close():
-  # switch from SPI to bitbanging
-  # ---------- flashing end -----------
-  sdr(b"\x20") # SPI WRITE DISABLE
-  sir_idle(b"\xFF",100,1) # BYPASS
-  sir_idle(b"\x26",2,200) # ISC DISABLE
-  sir_idle(b"\xFF",2,1) # BYPASS
-  sir(b"\x79") # LSC_REFRESH reload the bitstream from flash
-  sdr_idle(b"\x00\x00\x00",2,100)
-  spi_jtag_off()
-  reset_tap()
-  led.off()
-  bitbang_jtag_off()
-
 def stopwatch_start():
   global stopwatch_ms
   stopwatch_ms = ticks_ms()
@@ -474,19 +395,33 @@ def stopwatch_stop(bytes_uploaded):
     transfer_rate_kBps = bytes_uploaded // elapsed_ms
   print("%d bytes uploaded in %d ms (%d kB/s)" % (bytes_uploaded, elapsed_ms, transfer_rate_kBps))
 
+# first block is checked before programming mode,
+# returns False if rejected, FPGA keeps running design
 def prog_stream(filedata, blocksize=16384):
-  prog_open()
+  import bitstream
   bytes_uploaded = 0
   stopwatch_start()
   block = bytearray(blocksize)
-  while True:
-    if filedata.readinto(block):
+  n = filedata.readinto(block)
+  if not n or not bitstream.ecp5(memoryview(block)[:n], idcode()):
+    return False
+  prog_open()
+  try:
+    while n:
       hwspi.write(block)
-      bytes_uploaded += len(block)
-    else:
-      break
+      bytes_uploaded += n
+      n = filedata.readinto(block)
+  except:
+    # socket error or bad deflate data: FPGA out of
+    # programming mode, then caller gets the exception
+    prog_stream_done()
+    prog_close()
+    raise
   stopwatch_stop(bytes_uploaded)
+  if bitstream.max_length and bytes_uploaded > bitstream.max_length:
+    print("too long, %d bytes, device takes max %d" % (bytes_uploaded, bitstream.max_length))
   prog_stream_done()
+  return True
 
 def open_file(filename, gz=False):
   filedata = open(filename, "rb")
@@ -495,170 +430,110 @@ def open_file(filename, gz=False):
     return uzlib.DecompIO(filedata,31)
   return filedata
 
+# HTTP/1.1 with keep-alive, next request to the same
+# server reuses the connection. None if not found
 def open_web(url, gz=False):
-  import socket
-  _, _, host, path = url.split('/', 3)
-  port = 80
-  if ( len(host.split(':')) == 2 ):
-    host, port = host.split(':', 2)
-  print("host = %s, port = %d, path = %s" % (host, port, path))
-  addr = socket.getaddrinfo(host, port)[0][-1]
-  s = socket.socket()
-  s.connect(addr)
-  s.send(bytes('GET /%s HTTP/1.0\r\nHost: %s\r\nAccept:  image/*\r\n\r\n' % (path, host), 'utf8'))
-  for i in range(100): # read first 100 lines searching for
-    if len(s.readline()) < 3: # first empty line (contains "\r\n")
-      break
-  if gz:
-    import uzlib
-    return uzlib.DecompIO(s,31)
-  return s
-
-# data is bytearray of to-be-read length
-def flash_read(data, addr=0):
-  flash_open()
-  flash_read_block(data, addr)
-  flash_close()
-
-# accelerated compare flash and file block
-# return value
-# 0-must nothing, 1-must erase, 2-must write, 3-must erase and write
-@micropython.viper
-def compare_flash_file_buf(flash_b, file_b, must:int)->int:
-  flash_block = ptr8(addressof(flash_b))
-  file_block = ptr8(addressof(file_b))
-  l = int(len(file_b))
-  for i in range(l):
-    if (flash_block[i] & file_block[i]) != file_block[i]:
-      must = 1
-  if must: # erase will reset all bytes to 0xFF
-    for i in range(l):
-      if file_block[i] != 0xFF:
-        must = 3
-  else: # no erase
-    for i in range(l):
-      if flash_block[i] != file_block[i]:
-        must = 2
-  return must
-
-# clever = read-compare-erase-write
-# prevents flash wear when overwriting the same data
-# 4K erase block is max that fits on ESP32-WROOM
-# returns status True-OK False-Fail
-def flash_stream(filedata, addr=0):
-  flash_open()
-  addr_mask = flash_erase_size-1
-  if addr & addr_mask:
-    print("addr must be rounded to flash_erase_size = %d bytes (& 0x%06X)" % (flash_erase_size, 0xFFFFFF & ~addr_mask))
-    return False
-  addr = addr & 0xFFFFFF & ~addr_mask # rounded to even 64K (erase block)
-  bytes_uploaded = 0
-  stopwatch_start()
-  #if 1:
-  #  print("erase whole FLASH (max 90s)")
-  #  sdr(b"\x60") # SPI WRITE ENABLE
-  #  flash_wait_status(1005)
-  #  sdr(b"\xE3") # BULK ERASE (whole chip) rb[0x60]=0x06 or rb[0xC7]=0xE3
-  #  flash_wait_status(90000)
-  count_total = 0
-  count_erase = 0
-  count_write = 0
-  file_block = bytearray(flash_erase_size)
-  flash_block = bytearray(flash_read_size)
-  file_blockmv=memoryview(file_block)
-  progress_char="."
-  while filedata.readinto(file_block):
-    led.value((bytes_uploaded >> 12)&1)
-    retry = 3
-    while retry > 0:
-      must = 0
-      flash_rd = 0
-      while flash_rd<flash_erase_size:
-        flash_read_block(flash_block,addr+bytes_uploaded+flash_rd)
-        must = compare_flash_file_buf(flash_block,file_blockmv[flash_rd:flash_rd+flash_read_size],must)
-        flash_rd+=flash_read_size
-      write_addr = addr+bytes_uploaded
-      if must == 0:
-        if (write_addr & 0xFFFF) == 0:
-          print("\r0x%06X %dK %c" % (write_addr, flash_erase_size>>10, progress_char),end="")
-        else:
-          print(progress_char,end="")
-        progress_char="."
-        count_total += 1
-        bytes_uploaded += len(file_block)
-        break
-      retry -= 1
-      if must & 1: # must_erase:
-        #print("from 0x%06X erase %dK" % (write_addr, flash_erase_size>>10),end="\r")
-        flash_erase_block(write_addr)
-        count_erase += 1
-        progress_char = "e"
-      if must & 2: # must_write:
-        #print("from 0x%06X write %dK" % (write_addr, flash_erase_size>>10),end="\r")
-        block_addr = 0
-        next_block_addr = 0
-        while next_block_addr < len(file_block):
-          next_block_addr = block_addr+flash_write_size
-          flash_write_block(file_blockmv[block_addr:next_block_addr-1], file_blockmv[next_block_addr-1], write_addr)
-          write_addr += flash_write_size
-          block_addr = next_block_addr
-        count_write += 1
-        progress_char = "w"
-      #if not verify:
-      #  count_total += 1
-      #  bytes_uploaded += len(file_block)
-      #  break
-    if retry <= 0:
-      break
-  print("\r",end="")
-  stopwatch_stop(bytes_uploaded)
-  print("%dK blocks: %d total, %d erased, %d written." % (flash_erase_size>>10, count_total, count_erase, count_write))
-  return retry > 0 # True if successful
-
-def filedata_gz(filepath):
+  if web_cache:
+    import webcache
+    return webcache.open_url(url, gz)
+  import httpclient
+  return httpclient.open_url(url, gz)
+
+# cache: local copy of web file from webcache.fetch(),
+# opened instead of asking the server again
+def filedata_gz(filepath, cache=None):
   gz = filepath.endswith(".gz")
-  if filepath.startswith("http://") or filepath.startswith("/http:/"):
+  if cache:
+    filedata = open_file(cache, gz)
+  elif filepath.startswith("http://") or filepath.startswith("/http:/"):
     filedata = open_web(filepath, gz)
   else:
     filedata = open_file(filepath, gz)
   return filedata, gz
 
+# identifies bitstream without reading it:
+# local file by name, size and time, web file by
+# content hash in webcache. None if unknown
+def image_id(filepath):
+  try:
+    if filepath.startswith("http://") or filepath.startswith("/http:/"):
+      if web_cache:
+        import webcache
+        return webcache.fetch(filepath)
+      return None
+    st = uos.stat(filepath)
+    return "%s %d %d" % (filepath, st[6], st[8])
+  except OSError:
+    return None
+
+# FPGA SRAM no longer holds the remembered bitstream
+def forget():
+  global loaded_id
+  if loaded_id != "":
+    loaded_id = ""
+    try:
+      uos.remove(prog_state)
+    except OSError:
+      pass
+
+def remember(id):
+  global loaded_id
+  loaded_id = id
+  with open(prog_state, "w") as f:
+    f.write("%08X %s" % (loaded_usercode, id))
+
+# True if FPGA is configured (DONE) with bitstream "id"
+# and still reports USERCODE it had after loading it.
+# "/prog_state" survives power cycle, while FPGA then runs
+# FLASH design, so default USERCODE 0 (or none) can't tell
+# them apart: such bitstream is always loaded
+def prog_running(id):
+  try:
+    with open(prog_state) as f:
+      usercode, last_id = f.read().split(" ", 1)
+    usercode = int(usercode,16)
+  except (OSError, ValueError):
+    return False
+  if last_id != id or usercode == 0 or usercode == 0xFFFFFFFF:
+    return False
+  bitbang_jtag_on()
+  reset_tap()
+  runtest_idle(1,0)
+  running = read_usercode_status() == (usercode, True)
+  reset_tap()
+  bitbang_jtag_off()
+  return running
+
 def prog(filepath, close=True):
-  filedata, gz = filedata_gz(filepath)
+  id = None
+  if prog_skip and close:
+    id = image_id(filepath)
+    if id and prog_running(id):
+      print("already running %s" % filepath)
+      return True
+  cache = None
+  if id and web_cache and (filepath.startswith("http://") or filepath.startswith("/http:/")):
+    cache = id # image_id() already fetched it into webcache
+  filedata, gz = filedata_gz(filepath, cache)
   if filedata:
-    if gz:
-      prog_stream(filedata,blocksize=4096)
-    else:
-      prog_stream(filedata,blocksize=16384)
+    if not prog_stream(filedata,blocksize=4096 if gz else 16384):
+      return False
     # NOTE now the SD card can be released before bitstream starts
     if close:
-      return prog_close() # start the bitstream
+      done = prog_close() # start the bitstream
+      if done and id:
+        remember(id)
+      return done
     return True
   return False
 
-def flash(filepath, addr=0, close=True):
-  filedata, gz = filedata_gz(filepath)
-  if filedata:
-    status=flash_stream(filedata,addr)
-    # NOTE now the SD card can be released before bitstream starts
-    if close:
-      flash_close() # start the bitstream
-    return status
-  return False
-
-def flashrd(addr=0, length=1):
-  data = bytearray(length)
-  flash_read(data, addr)
-  return data
-
 def passthru():
   id = idcode()
   if id != 0 and id != 0xFFFFFFFF:
     filepath = "passthru%08x.bit.gz" % id
     print("ecp5.prog(\"%s\")" % filepath)
     filedata = open_file(filepath, gz=True)
-    prog_stream(filedata,blocksize=4096)
-    return prog_close()
+    return prog_stream(filedata,blocksize=4096) and prog_close()
   return False
 
 def help():
@@ -668,5 +543,6 @@ def help():
   print("ecp5.prog(\"http://192.168.4.2/blink.bit\")")
   print("ecp5.prog(\"blink.bit.gz\") # gzip -9 blink.bit")
   print("ecp5.passthru()")
+  print("ecp5.run([(\"flash\",\"blink.bit\",0), (\"verify\",\"blink.bit\",0)])")
   print("\"0x%08X\" % ecp5.idcode()")
   print("0x%08X" % idcode())
@@ -0,0 +1,340 @@
+# micropython ESP32
+# ECP5 SPI FLASH programmer
+
+# AUTHOR=EMARD
+# LICENSE=BSD
+
+# FLASH part of ecp5.py, imported by ecp5 on first use of
+# a FLASH function, so prog-only use doesn't load it.
+# JTAG pins and state stay in ecp5 module.
+
+from time import ticks_ms, sleep_ms
+from micropython import const
+from uctypes import addressof
+import ecp5
+from ecp5 import send_tms, send_tms0111, send_int_msb1st, reset_tap, runtest_idle
+from ecp5 import sir, sir_idle, sdr, sdr_idle, common_open, spi_jtag_off, bitbang_jtag_off
+from ecp5 import stopwatch_start, stopwatch_stop, filedata_gz, prog
+
+flash_read_size = const(2048)
+flash_write_size = const(256)
+flash_erase_size = const(4096)
+flash_erase_cmd = { 4096:0x20, 32768:0x52, 65536:0xD8, 262144:0xD8 } # erase commands from FLASH PDF
+flash_era = bytearray([flash_erase_cmd[flash_erase_size],0,0])
+flash_req=bytearray(4)
+read_status=bytearray([5])
+status=bytearray(1)
+
+# call this before sending the flash image
+# FPGA will enter flashing mode
+# TAP should be in "select DR scan" state
+# nothing to do if already in flashing mode
+def flash_open():
+  if ecp5.flash_mode:
+    return
+  ecp5.flash_mode = True
+  common_open()
+  reset_tap()
+  runtest_idle(1,0)
+  sir_idle(b"\xFF",32,0) # BYPASS
+  sir(b"\x3A") # LSC_PROG_SPI
+  sdr_idle(b"\xFE\x68",32,0)
+  # ---------- flashing begin -----------
+  # sdr("\x60") and other SPI FLASH commands
+  # here are bitreverse() values of FLASH commands
+  # found in datasheet. e.g.
+  # \x1B -> 0xD8
+  # \x60 -> 0x06 ...
+
+@micropython.viper
+def flash_wait_status(n:int):
+  retry=n
+  mask=1 # WIP bit (work-in-progress)
+  send_tms(0) # -> capture DR
+  send_tms(0) # -> shift DR
+  ecp5.swspi.write(read_status) # READ STATUS REGISTER
+  ecp5.swspi.readinto(status)
+  while retry > 0:
+    ecp5.swspi.readinto(status)
+    if (int(status[0]) & mask) == 0:
+      break
+    sleep_ms(1)
+    retry -= 1
+  send_tms(1) # -> exit 1 DR # exit at byte incomplete
+  #send_int_msb1st(0,1,8) # exit at byte complete
+  send_tms0111() # -> select DR scan
+  if retry <= 0:
+    print("error %d flash status 0x%02X & 0x%02X != 0" % (n,status[0],mask))
+
+@micropython.viper
+def flash_erase_block(addr:int):
+  sdr(b"\x60") # SPI WRITE ENABLE
+  flash_wait_status(1001)
+  p8=ptr8(addressof(flash_era))
+  p8[1]=addr>>16
+  p8[2]=addr>>8
+  send_tms(0) # -> capture DR
+  send_tms(0) # -> shift DR
+  ecp5.swspi.write(flash_era) # except LSB
+  send_int_msb1st(addr,1,8) # last LSB byte -> exit 1 DR
+  send_tms0111() # -> select DR scan
+  flash_wait_status(2002)
+
+@micropython.viper
+def flash_write_block(block, last:int, addr:int):
+  sdr(b"\x60") # SPI WRITE ENABLE
+  flash_wait_status(1003)
+  p8=ptr8(addressof(flash_req))
+  p8[0]=2
+  p8[1]=addr>>16
+  p8[2]=addr>>8
+  p8[3]=addr
+  send_tms(0) # -> capture DR
+  send_tms(0) # -> shift DR
+  ecp5.swspi.write(flash_req)
+  ecp5.swspi.write(block) # whole block
+  send_int_msb1st(last,1,8) # last byte -> exit 1 DR
+  send_tms0111() # -> select DR scan
+  flash_wait_status(1004)
+
+# data is bytearray of to-be-read length
+@micropython.viper
+def flash_read_block(data, addr:int):
+  p8=ptr8(addressof(flash_req))
+  p8[0]=3
+  p8[1]=addr>>16
+  p8[2]=addr>>8
+  p8[3]=addr
+  send_tms(0) # -> capture DR
+  send_tms(0) # -> shift DR
+  ecp5.swspi.write(flash_req) # send SPI FLASH read command and address and dummy byte
+  ecp5.swspi.readinto(data) # retrieve whole block
+  send_int_msb1st(0,1,8) # dummy read byte -> exit 1 DR
+  send_tms0111() # -> select DR scan
+
+# call this after uploading all of the flash blocks,
+# this will exit FPGA flashing mode and start the bitstream
+# within session flashing mode stays open
+def flash_close():
+  if ecp5.hold:
+    return
+  ecp5.flash_mode = False
+  flash_end(True)
+
+# refresh: reload the bitstream from flash
+def flash_end(refresh):
+  # switch from SPI to bitbanging
+  # ---------- flashing end -----------
+  sdr(b"\x20") # SPI WRITE DISABLE
+  sir_idle(b"\xFF",100,1) # BYPASS
+  sir_idle(b"\x26",2,200) # ISC DISABLE
+  sir_idle(b"\xFF",2,1) # BYPASS
+  if refresh:
+    sir(b"\x79") # LSC_REFRESH reload the bitstream from flash
+    sdr_idle(b"\x00\x00\x00",2,100)
+  spi_jtag_off()
+  reset_tap()
+  ecp5.led.off()
+  bitbang_jtag_off()
+
+# data is bytearray of to-be-read length
+def flash_read(data, addr=0):
+  flash_open()
+  flash_read_block(data, addr)
+  flash_close()
+
+# accelerated compare flash and file block
+# return value
+# 0-must nothing, 1-must erase, 2-must write, 3-must erase and write
+@micropython.viper
+def compare_flash_file_buf(flash_b, file_b, must:int)->int:
+  flash_block = ptr8(addressof(flash_b))
+  file_block = ptr8(addressof(file_b))
+  l = int(len(file_b))
+  for i in range(l):
+    if (flash_block[i] & file_block[i]) != file_block[i]:
+      must = 1
+  if must: # erase will reset all bytes to 0xFF
+    for i in range(l):
+      if file_block[i] != 0xFF:
+        must = 3
+  else: # no erase
+    for i in range(l):
+      if flash_block[i] != file_block[i]:
+        must = 2
+  return must
+
+# clever = read-compare-erase-write
+# prevents flash wear when overwriting the same data
+# 4K erase block is max that fits on ESP32-WROOM
+# returns status True-OK False-Fail
+def flash_stream(filedata, addr=0):
+  flash_open()
+  addr_mask = flash_erase_size-1
+  if addr & addr_mask:
+    print("addr must be rounded to flash_erase_size = %d bytes (& 0x%06X)" % (flash_erase_size, 0xFFFFFF & ~addr_mask))
+    return False
+  addr = addr & 0xFFFFFF & ~addr_mask # rounded to even 64K (erase block)
+  bytes_uploaded = 0
+  stopwatch_start()
+  #if 1:
+  #  print("erase whole FLASH (max 90s)")
+  #  sdr(b"\x60") # SPI WRITE ENABLE
+  #  flash_wait_status(1005)
+  #  sdr(b"\xE3") # BULK ERASE (whole chip) rb[0x60]=0x06 or rb[0xC7]=0xE3
+  #  flash_wait_status(90000)
+  count_total = 0
+  count_erase = 0
+  count_write = 0
+  file_block = bytearray(flash_erase_size)
+  flash_block = bytearray(flash_read_size)
+  file_blockmv=memoryview(file_block)
+  progress_char="."
+  while filedata.readinto(file_block):
+    ecp5.led.value((bytes_uploaded >> 12)&1)
+    retry = 3
+    while retry > 0:
+      must = 0
+      flash_rd = 0
+      while flash_rd<flash_erase_size:
+        flash_read_block(flash_block,addr+bytes_uploaded+flash_rd)
+        must = compare_flash_file_buf(flash_block,file_blockmv[flash_rd:flash_rd+flash_read_size],must)
+        flash_rd+=flash_read_size
+      write_addr = addr+bytes_uploaded
+      if must == 0:
+        if (write_addr & 0xFFFF) == 0:
+          print("\r0x%06X %dK %c" % (write_addr, flash_erase_size>>10, progress_char),end="")
+        else:
+          print(progress_char,end="")
+        progress_char="."
+        count_total += 1
+        bytes_uploaded += len(file_block)
+        break
+      retry -= 1
+      if must & 1: # must_erase:
+        #print("from 0x%06X erase %dK" % (write_addr, flash_erase_size>>10),end="\r")
+        flash_erase_block(write_addr)
+        count_erase += 1
+        progress_char = "e"
+      if must & 2: # must_write:
+        #print("from 0x%06X write %dK" % (write_addr, flash_erase_size>>10),end="\r")
+        block_addr = 0
+        next_block_addr = 0
+        while next_block_addr < len(file_block):
+          next_block_addr = block_addr+flash_write_size
+          flash_write_block(file_blockmv[block_addr:next_block_addr-1], file_blockmv[next_block_addr-1], write_addr)
+          write_addr += flash_write_size
+          block_addr = next_block_addr
+        count_write += 1
+        progress_char = "w"
+      #if not verify:
+      #  count_total += 1
+      #  bytes_uploaded += len(file_block)
+      #  break
+    if retry <= 0:
+      break
+  print("\r",end="")
+  stopwatch_stop(bytes_uploaded)
+  print("%dK blocks: %d total, %d erased, %d written." % (flash_erase_size>>10, count_total, count_erase, count_write))
+  return retry > 0 # True if successful
+
+def flash(filepath, addr=0, close=True):
+  filedata, gz = filedata_gz(filepath)
+  if filedata:
+    status=flash_stream(filedata,addr)
+    # NOTE now the SD card can be released before bitstream starts
+    if close:
+      flash_close() # start the bitstream
+    return status
+  return False
+
+def flashrd(addr=0, length=1):
+  data = bytearray(length)
+  flash_read(data, addr)
+  return data
+
+# compare flash with file, nothing is written
+# returns True if equal
+def verify(filepath, addr=0, close=True):
+  filedata, gz = filedata_gz(filepath)
+  if not filedata:
+    return False
+  flash_open()
+  file_block = bytearray(flash_read_size)
+  flash_block = bytearray(flash_read_size)
+  equal = True
+  while equal:
+    n = filedata.readinto(file_block)
+    if not n:
+      break
+    flash_read_block(flash_block, addr)
+    equal = flash_block[:n] == file_block[:n]
+    addr += n
+  if close:
+    flash_close()
+  if not equal:
+    print("differs at 0x%06X" % (addr-n))
+  return equal
+
+# one JTAG session for several operations, FPGA enters
+# flashing mode once instead of at each operation.
+# Steps are timed, report printed at the end.
+# with ecp5.session() as s:
+#   s.flash("blink.bit", 0x000000)
+#   s.flash("data.bin", 0x200000)
+#   s.verify("blink.bit", 0x000000)
+#   s.flashrd(0x200000, 16)
+#   s.prog("blink.bit")
+class session:
+
+  def __init__(self):
+    self.times = [] # (step, ms, result)
+
+  def __enter__(self):
+    ecp5.hold = True
+    self.start = ticks_ms()
+    return self
+
+  def __exit__(self, *args):
+    ecp5.hold = False
+    if ecp5.flash_mode:
+      flash_close()
+    self.report()
+
+  def step(self, name, fn, *args):
+    t = ticks_ms()
+    result = fn(*args)
+    self.times.append((name, ticks_ms() - t, result))
+    return result
+
+  def flash(self, filepath, addr=0):
+    return self.step("flash %s 0x%06X" % (filepath, addr), flash, filepath, addr)
+
+  def verify(self, filepath, addr=0):
+    return self.step("verify %s 0x%06X" % (filepath, addr), verify, filepath, addr)
+
+  def flashrd(self, addr=0, length=1):
+    return self.step("flashrd 0x%06X %d" % (addr, length), flashrd, addr, length)
+
+  # SRAM load ends flashing mode without reload from flash
+  def prog(self, filepath):
+    if ecp5.flash_mode:
+      ecp5.flash_mode = False
+      flash_end(False)
+    return self.step("prog %s" % filepath, prog, filepath)
+
+  def report(self):
+    for name, ms, result in self.times:
+      print("%6d ms %s%s" % (ms, name, "" if result else " FAIL"))
+    print("%6d ms total" % (ticks_ms() - self.start))
+
+# steps: list of (method, args...) of session
+# stops at first failed step, returns True if all succeed
+# ecp5.run([("flash","blink.bit",0), ("verify","blink.bit",0)])
+def run(steps):
+  with session() as s:
+    for step in steps:
+      if not getattr(s, step[0])(*step[1:]):
+        print("stop at %s" % step[0])
+        return False
+  return True
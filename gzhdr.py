@@ -0,0 +1,24 @@
+# micropython ESP32
+# gzip header parser
+
+# LICENSE=BSD
+
+# used by uftpd and httpclient which give uzlib.DecompIO
+# the socket itself with raw deflate (wbits -15), because
+# uzlib reads its source byte by byte.
+
+# skip rest of gzip header after 2 magic bytes,
+# raw deflate data follows
+def gzip_header(s):
+  flags = s.read(8)[1] # method, flags, mtime, xfl, os
+  if flags & 4: # FEXTRA
+    n = s.read(2)
+    s.read(n[0] | (n[1] << 8))
+  if flags & 8: # FNAME
+    while s.read(1) not in (b"\x00", b""):
+      pass
+  if flags & 16: # FCOMMENT
+    while s.read(1) not in (b"\x00", b""):
+      pass
+  if flags & 2: # FHCRC
+    s.read(2)
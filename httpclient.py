@@ -0,0 +1,405 @@
+# micropython ESP32
+# HTTP/1.1 streaming client
+
+# LICENSE=BSD
+
+# keeps one idle connection open, so subsequent requests
+# to the same server reuse it. Supports Content-Length,
+# chunked transfer encoding and redirects.
+# Interrupted downloads are resumed with Range requests,
+# ".gz" with Content-Length is downloaded again and inflated
+# up to where it stopped.
+# usage:
+# f = httpclient.open_url("http://192.168.4.2/blink.bit")
+# f.readinto(buf)
+
+import socket
+import uio
+from time import sleep_ms
+from micropython import const
+
+_TIMEOUT = const(10) # s
+_REDIRECTS = const(5)
+_DRAIN = const(2048) # max unread body bytes to skip for connection reuse
+_RESUME = const(10) # max reconnects of one download
+_RESUME_MS = const(1000) # wait before reconnect
+
+# idle keep-alive connection: (host, port, socket)
+_idle = None
+# last response, its connection is reused after body is read
+_active = None
+
+# "http://host[:port]/path" or "/http:/host[:port]/path"
+# returns (host, port, path)
+def parse_url(url):
+  _, _, host, path = url.split('/', 3)
+  port = 80
+  if ( len(host.split(':')) == 2 ):
+    host, port = host.split(':', 2)
+    port = int(port)
+  return host, port, "/" + path
+
+def connect(host, port):
+  global _idle
+  if _idle:
+    if _idle[0] == host and _idle[1] == port:
+      s = _idle[2]
+      _idle = None
+      return s, True
+    _idle[2].close()
+    _idle = None
+  addr = socket.getaddrinfo(host, port)[0][-1]
+  s = socket.socket()
+  s.settimeout(_TIMEOUT)
+  s.connect(addr)
+  return s, False
+
+# put connection back for next request
+def release(s, host, port):
+  global _idle
+  if _idle:
+    _idle[2].close()
+  _idle = (host, port, s)
+
+def close():
+  global _idle, _active
+  if _active:
+    _active.close()
+    _active = None
+  if _idle:
+    _idle[2].close()
+    _idle = None
+
+# body of HTTP response as readable stream.
+# readinto() fills buffer completely until end of body.
+# IOBase makes it usable as source for uzlib.DecompIO
+class response(uio.IOBase):
+
+  def __init__(self, s, host, port, status, headers, keep):
+    self.sock = s
+    self.host = host
+    self.port = port
+    self.status = status
+    self.headers = headers # dict of lowercase names
+    self.keep = keep
+    self.chunked = headers.get("transfer-encoding", "").lower() == "chunked"
+    self.remain = None # unknown length, read until connection closes
+    if self.chunked:
+      self.remain = 0
+      self.chunk_end = False # CRLF after chunk data pending
+    elif "content-length" in headers:
+      self.remain = int(headers["content-length"])
+    elif status == 204 or status == 304:
+      self.remain = 0
+    else:
+      self.keep = False
+    self.done = False
+    self.truncated = False # connection closed before end of body
+
+  # start next chunk, returns False at last chunk
+  def next_chunk(self):
+    if self.chunk_end:
+      self.sock.readline() # CRLF
+    line = self.sock.readline()
+    if not line:
+      self.keep = False
+      self.truncated = True
+      return False
+    self.remain = int(line.split(b";")[0].strip(), 16)
+    self.chunk_end = True
+    if self.remain == 0: # skip trailer
+      while len(self.sock.readline()) > 2:
+        pass
+      return False
+    return True
+
+  def readinto(self, buf):
+    if self.done:
+      return 0
+    mv = memoryview(buf)
+    n = 0
+    while n < len(buf):
+      if self.remain == 0:
+        if not (self.chunked and self.next_chunk()):
+          self.finish()
+          break
+      want = len(buf)-n
+      if self.remain is not None and self.remain < want:
+        want = self.remain
+      m = self.sock.readinto(mv[n:n+want])
+      if not m: # connection closed
+        self.keep = False
+        self.truncated = self.remain is not None
+        self.finish()
+        break
+      n += m
+      if self.remain is not None:
+        self.remain -= m
+    return n
+
+  def read(self, size):
+    buf = bytearray(size)
+    return buf[:self.readinto(buf)]
+
+  # body completely read
+  def finish(self):
+    global _active
+    if self.done:
+      return
+    self.done = True
+    if _active is self:
+      _active = None
+    if self.keep:
+      release(self.sock, self.host, self.port)
+    else:
+      self.sock.close()
+    self.sock = None
+
+  # take socket over, response is done and connection not reused
+  def detach(self):
+    global _active
+    s = self.sock
+    self.sock = None
+    self.keep = False
+    self.done = True
+    if _active is self:
+      _active = None
+    return s
+
+  # skip small rest of body to keep connection, else close it
+  def close(self):
+    if self.done:
+      return
+    if self.keep and not self.chunked and self.remain is not None and self.remain <= _DRAIN:
+      buf = bytearray(256)
+      try:
+        while self.readinto(buf):
+          pass
+      except OSError:
+        self.keep = False
+    if not self.done:
+      self.keep = False
+      self.finish()
+
+# send GET and parse response header
+# extra: additional header lines, each ending with "\r\n"
+def request(host, port, path, extra=""):
+  global _active
+  if _active:
+    _active.close()
+    _active = None
+  req = bytes('GET %s HTTP/1.1\r\nHost: %s\r\nAccept: */*\r\n%s\r\n' % (path, host, extra), 'utf8')
+  while True:
+    s, reused = connect(host, port)
+    try:
+      s.send(req)
+      line = s.readline()
+    except OSError:
+      line = b""
+    if line:
+      break
+    s.close()
+    if not reused:
+      raise OSError("no response")
+    # server closed idle connection, try again with new one
+  items = line.decode().split(None, 2)
+  version = items[0]
+  status = int(items[1])
+  headers = {}
+  while True:
+    line = s.readline()
+    if len(line) < 3: # empty line (contains "\r\n")
+      break
+    name, value = line.decode().split(":", 1)
+    headers[name.strip().lower()] = value.strip()
+  connection = headers.get("connection", "").lower()
+  if version == "HTTP/1.0":
+    keep = connection == "keep-alive"
+  else:
+    keep = connection != "close"
+  _active = response(s, host, port, status, headers, keep)
+  return _active
+
+# GET url following redirects
+# returns response, check its status
+def get(url, extra=""):
+  host, port, path = parse_url(url)
+  for i in range(_REDIRECTS):
+    r = request(host, port, path, extra)
+    if r.status in (301, 302, 303, 307, 308) and "location" in r.headers:
+      location = r.headers["location"]
+      r.close()
+      if location.startswith("http://"):
+        host, port, path = parse_url(location)
+      elif location.startswith("/"):
+        path = location
+      else:
+        path = path[:path.rfind("/")+1] + location
+      print("redirect %s" % location)
+    else:
+      return r
+  return r
+
+# response body which survives lost connection.
+# Reconnects and continues with "Range: bytes=offset-" exactly
+# where the data stopped, filling the same buffer. Readers see
+# only complete buffers, so flash_stream() erase blocks and
+# sd_write_stream() sectors are never split by a reconnect.
+# For response to "Range: bytes=start-end" request, give start and end.
+class resumable(uio.IOBase):
+
+  def __init__(self, url, r, start=0, end=None):
+    self.url = url
+    self.r = r
+    self.offset = start # file position of next body byte
+    self.end = end # last byte of requested range
+    self.retries = _RESUME
+    # resume only if the file is still the same
+    self.validator = r.headers.get("etag") or r.headers.get("last-modified")
+
+  def readinto(self, buf):
+    mv = memoryview(buf)
+    n = 0
+    while n < len(buf):
+      try:
+        m = self.r.readinto(mv[n:])
+        lost = self.r.truncated
+      except OSError as e:
+        print(e)
+        m = 0
+        lost = True
+        self.r.keep = False
+        self.r.finish()
+      n += m
+      self.offset += m
+      if not lost:
+        break
+      self.reconnect()
+    return n
+
+  def reconnect(self):
+    extra = "Range: bytes=%d-%s\r\n" % (self.offset, "" if self.end is None else self.end)
+    if self.validator:
+      extra += "If-Range: %s\r\n" % self.validator
+    while True:
+      if self.retries <= 0:
+        raise OSError("resume failed")
+      self.retries -= 1
+      print("resume at %d" % self.offset)
+      sleep_ms(_RESUME_MS)
+      try:
+        r = get(self.url, extra)
+        break
+      except OSError as e:
+        print(e)
+    if r.status != 206 or not r.headers.get("content-range", "").startswith("bytes %d-" % self.offset):
+      r.close()
+      raise OSError("can't resume, HTTP %d" % r.status)
+    self.r = r
+
+  def read(self, size):
+    buf = bytearray(size)
+    return buf[:self.readinto(buf)]
+
+  def close(self):
+    self.r.close()
+
+# gzip body inflated straight from the socket: uzlib reads
+# its source byte by byte, python level stream would be slow.
+# Deflate can't continue in the middle of the stream, so after
+# lost connection the file is downloaded again and the bytes
+# already delivered are inflated and skipped. Readers see only
+# complete buffers, as with resumable.
+class gunzip:
+
+  def __init__(self, url, r):
+    self.url = url
+    self.offset = 0 # inflated bytes delivered
+    self.retries = _RESUME
+    self.validator = r.headers.get("etag") or r.headers.get("last-modified")
+    self.sock = None
+    self.gz = self.start(r)
+
+  # inflate body of response r, False if not gzip
+  def start(self, r):
+    import uzlib
+    from gzhdr import gzip_header
+    self.sock = r.detach()
+    if self.sock.read(2) != b"\x1f\x8b":
+      return False
+    gzip_header(self.sock)
+    self.z = uzlib.DecompIO(self.sock, -15)
+    return True
+
+  def readinto(self, buf):
+    mv = memoryview(buf)
+    n = 0
+    while n < len(buf):
+      try:
+        m = self.z.readinto(mv[n:])
+      except OSError as e:
+        print(e)
+        self.restart(self.offset+n)
+        continue
+      if not m:
+        break
+      n += m
+    self.offset += n
+    return n
+
+  # download again and skip first "skip" inflated bytes
+  def restart(self, skip):
+    buf = bytearray(512)
+    while True:
+      self.sock.close()
+      if self.retries <= 0:
+        raise OSError("resume failed")
+      self.retries -= 1
+      print("restart, skip %d" % skip)
+      sleep_ms(_RESUME_MS)
+      try:
+        r = get(self.url)
+        if r.status != 200 or (r.headers.get("etag") or r.headers.get("last-modified")) != self.validator:
+          r.close()
+          self.retries = 0 # file changed
+          raise OSError("can't resume, HTTP %d" % r.status)
+        if not self.start(r):
+          raise OSError("not gzip")
+        n = skip
+        while n:
+          m = self.z.readinto(memoryview(buf)[:min(n, len(buf))])
+          if not m:
+            raise OSError("file shorter")
+          n -= m
+        return
+      except OSError as e:
+        print(e)
+
+  def read(self, size):
+    buf = bytearray(size)
+    return buf[:self.readinto(buf)]
+
+  def close(self):
+    self.sock.close()
+
+# open url for reading, like open_file()
+# returns stream or None if not found
+def open_url(url, gz=False):
+  host, port, path = parse_url(url)
+  print("host = %s, port = %d, path = %s" % (host, port, path))
+  r = get(url)
+  if r.status < 200 or r.status > 299:
+    print("HTTP %d %s" % (r.status, url))
+    r.close()
+    return None
+  if gz:
+    import uzlib
+    if not r.chunked:
+      f = gunzip(url, r)
+      if not f.gz:
+        f.close()
+        print("not gzip %s" % url)
+        return None
+      return f
+    return uzlib.DecompIO(resumable(url, r),31)
+  return resumable(url, r)
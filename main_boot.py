@@ -0,0 +1,116 @@
+# micropython ESP32
+# parallel boot: FPGA, WiFi, FTP, NTP
+
+# LICENSE=BSD
+
+# copy as "main.py", instead of main_wifiman.py.
+# Stages overlap instead of waiting for each other:
+# FPGA loads local or cached bitstream at once while
+# wifiman connects in background thread, FTP server
+# starts as soon as AP or STA interface has address,
+# NTP runs in background with short timeout.
+# Web bitstream is checked for update when WiFi is up.
+# Each stage prints time since boot:
+#   boot   140 ms FPGA autostart.bit
+#   boot  1910 ms WiFi
+#   boot  2450 ms FTP
+
+import _thread
+import network
+from time import ticks_ms, ticks_diff, sleep_ms
+import ecp5
+
+bitstream = "autostart.bit" # local file or URL kept in webcache
+ntp_timeout = 2 # s
+
+start = ticks_ms()
+wifi_done = False
+
+def stage(name):
+  print("boot %5d ms %s" % (ticks_diff(ticks_ms(), start), name))
+
+def web():
+  return bitstream.startswith("http://")
+
+# load bitstream from file, True if loaded
+def fpga(filename):
+  if not filename:
+    return False
+  gz = bitstream.endswith(".gz")
+  try:
+    filedata = ecp5.open_file(filename, gz)
+  except OSError:
+    print("%s not found" % filename)
+    return False
+  if not ecp5.prog_stream(filedata, blocksize=4096 if gz else 16384):
+    return False
+  return ecp5.prog_close()
+
+def wifi():
+  global wifi_done
+  try:
+    import wifiman # connects at import
+    stage("WiFi")
+  except Exception as e:
+    print("no WiFi", e)
+  wifi_done = True
+
+def ntp():
+  import ntptime
+  ntptime.timeout = ntp_timeout
+  try:
+    ntptime.settime()
+    stage("NTP")
+  except Exception:
+    print("NTP not available")
+
+# multiboot jump sector, rewritten if power
+# failed while it was written
+def repair():
+  try:
+    import multiboot
+  except ImportError:
+    return
+  if not multiboot.repair():
+    print("multiboot repair failed")
+
+# interface with address, or None
+def address():
+  for i in (network.AP_IF, network.STA_IF):
+    wlan = network.WLAN(i)
+    if wlan.active() and wlan.ifconfig()[0] != "0.0.0.0":
+      return wlan.ifconfig()[0]
+  return None
+
+def boot():
+  _thread.stack_size(8192)
+  _thread.start_new_thread(wifi, ())
+  repair()
+  cached = bitstream
+  if web():
+    import webcache
+    cached = webcache.cached(bitstream)
+  if fpga(cached):
+    stage("FPGA %s" % bitstream)
+  while not address() and not wifi_done:
+    sleep_ms(50)
+  if not address():
+    print("no network")
+    return
+  import uftpd
+  stage("FTP")
+  while not wifi_done:
+    sleep_ms(50)
+  uftpd.update_addr(splash=False) # STA address after FTP start
+  _thread.start_new_thread(ntp, ())
+  if web():
+    import webcache
+    try:
+      filename = webcache.fetch(bitstream)
+    except OSError as e:
+      print(e)
+      filename = None
+    if filename and filename != cached and fpga(filename):
+      stage("FPGA updated %s" % bitstream)
+
+boot()
@@ -0,0 +1,181 @@
+# micropython ESP32
+# ECP5 multiboot FLASH layout
+
+# LICENSE=BSD
+
+# FLASH holds several bitstreams in slots. Sector at 0 holds
+# a small jump bitstream (like trellis ecpmulti) which makes
+# FPGA boot from the active slot. update() writes new image
+# into an inactive slot, then rewrites only the jump sector,
+# so the golden and active images are never touched and a
+# failed write leaves the old image booting. Which slot holds
+# which image is remembered in "/multiboot.json" on ESP32.
+# New jump block is first written to spare sector, then to
+# sector 0. FPGA boots only from 0, so power failure while
+# sector 0 is erased leaves it unbootable until repair()
+# rewrites it from the state or spare copy. main_boot.py
+# calls repair() at every start.
+# usage:
+# import multiboot
+# multiboot.write("golden", "golden.bit") # once
+# multiboot.update("http://192.168.4.2/blink.bit")
+# multiboot.select("golden")
+# multiboot.info()
+
+import ujson
+import uhashlib
+from ubinascii import hexlify
+from uio import BytesIO
+import ecp5
+
+pointer = 0x000000 # jump sector address
+spare = 0x010000 # copy of jump sector, written first
+slot_size = 0x300000 # max bitstream size
+slots = { "golden":0x100000, "primary":0x400000, "alternate":0x700000 }
+state_file = "/multiboot.json"
+
+def load():
+  try:
+    with open(state_file) as f:
+      return ujson.load(f)
+  except (OSError, ValueError):
+    return {"active": None, "images": {}}
+
+def save(state):
+  with open(state_file, "w") as f:
+    ujson.dump(state, f)
+
+# erase block with bitstream preamble and
+# jump to addr (SPI FLASH read command 0x03)
+def jump_block(addr):
+  block = bytearray(b"\xFF" * ecp5.flash_erase_size)
+  jump = bytes([0xFF,0xFF,0xBD,0xB3, 0xFF,0xFF,0xFF,0xFF,
+    0x7E,0x00,0x00,0x00, 0x03, (addr>>16)&0xFF, (addr>>8)&0xFF, addr&0xFF])
+  block[0:len(jump)] = jump
+  return block
+
+# passes file to flash_stream(), hashing it.
+# stops at slot_size, so next slot is never overwritten
+class slot_stream:
+
+  def __init__(self, filedata):
+    self.filedata = filedata
+    self.hash = uhashlib.sha256()
+    self.size = 0
+    self.overflow = False
+
+  def readinto(self, buf):
+    if self.size + len(buf) > slot_size:
+      self.overflow = self.filedata.readinto(buf) > 0
+      return 0
+    n = self.filedata.readinto(buf)
+    if n:
+      self.hash.update(memoryview(buf)[:n])
+      self.size += n
+    return n
+
+# returns image hash or None
+def write_slot(name, filepath):
+  filedata, gz = ecp5.filedata_gz(filepath)
+  if not filedata:
+    return None
+  stream = slot_stream(filedata)
+  ok = ecp5.flash_stream(stream, slots[name])
+  if stream.overflow:
+    print("%s larger than slot %s, %d bytes" % (filepath, name, slot_size))
+    return None
+  if not ok:
+    return None
+  return hexlify(stream.hash.digest()).decode()[:16]
+
+def write_pointer(name):
+  block = jump_block(slots[name])
+  if not ecp5.flash_stream(BytesIO(block), spare):
+    return False
+  return ecp5.flash_stream(BytesIO(block), pointer)
+
+# write image to slot, without switching to it.
+# Active slot is refused unless force=True
+def write(name, filepath, force=False):
+  state = load()
+  if name == state["active"] and not force:
+    print("slot %s is active, select another one first or force=True" % name)
+    return False
+  with ecp5.session() as s:
+    image = s.step("write %s" % name, write_slot, name, filepath)
+    if state["active"] is None and image:
+      # first image, make it bootable
+      if s.step("jump %s" % name, write_pointer, name):
+        state["active"] = name
+  state["images"][name] = image
+  save(state)
+  return image is not None
+
+# boot from slot: rewrite jump sector
+def select(name):
+  state = load()
+  if not state["images"].get(name):
+    print("slot %s is empty" % name)
+    return False
+  with ecp5.session() as s:
+    ok = s.step("jump %s" % name, write_pointer, name)
+  if ok:
+    state["active"] = name
+    save(state)
+  return ok
+
+# write image to inactive slot (never golden), then switch to it
+def update(filepath):
+  state = load()
+  active = state["active"]
+  for name in slots:
+    if name != "golden" and name != active:
+      break
+  else:
+    print("no inactive slot")
+    return False
+  with ecp5.session() as s:
+    # old image in this slot is gone from now on
+    state["images"][name] = None
+    save(state)
+    image = s.step("write %s" % name, write_slot, name, filepath)
+    if not image:
+      return False
+    state["images"][name] = image
+    save(state)
+    if not s.step("jump %s" % name, write_pointer, name):
+      return False
+  state["active"] = name
+  save(state)
+  return True
+
+# slot name jump block head points to, None if not valid
+def jump_target(head):
+  for name in slots:
+    if head == jump_block(slots[name])[:16]:
+      return name
+  return None
+
+# jump sector should point to active slot. If state has
+# no active slot (power failed before it was saved),
+# spare copy tells which slot was being selected
+def repair():
+  state = load()
+  if not state["images"]:
+    return True # multiboot not used
+  ok = True
+  with ecp5.session() as s:
+    active = state["active"] or jump_target(ecp5.flashrd(spare, 16))
+    if active and jump_target(ecp5.flashrd(pointer, 16)) != active:
+      ok = s.step("jump %s" % active, write_pointer, active)
+      if ok:
+        print("jump sector repaired, boot %s" % active)
+        state["active"] = active
+        save(state)
+  return ok
+
+def info():
+  state = load()
+  for name in slots:
+    print("%s %-10s 0x%06X %s" % ("*" if name == state["active"] else " ",
+      name, slots[name], state["images"].get(name) or "-"))
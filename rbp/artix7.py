@@ -399,8 +399,7 @@ class artix7:
   @micropython.viper
   def flash_open(self):
     file="jtagspi%08x.bit.gz" % self.idcode()
-    self.prog_stream(self.open_file(file,True))
-    if not self.prog_close():
+    if not (self.prog_stream(self.open_file(file,True)) and self.prog_close()):
       print("%s failed" % file)
     self.common_open()
     self.reset_tap()
@@ -476,19 +475,26 @@ class artix7:
       transfer_rate_kBps = bytes_uploaded // elapsed_ms
     print("%d bytes uploaded in %d ms (%d kB/s)" % (bytes_uploaded, elapsed_ms, transfer_rate_kBps))
 
+  # first block is checked before programming mode,
+  # returns False if rejected, FPGA keeps running design
   def prog_stream(self, filedata, blocksize=16384):
-    self.prog_open()
+    import bitstream
     bytes_uploaded = 0
     self.stopwatch_start()
     block = bytearray(blocksize)
-    while True:
-      if filedata.readinto(block):
-        self.hwspi.write(block)
-        bytes_uploaded += len(block)
-      else:
-        break
+    n = filedata.readinto(block)
+    if not n or not bitstream.xilinx(memoryview(block)[:n], self.idcode()):
+      return False
+    self.prog_open()
+    while n:
+      self.hwspi.write(block)
+      bytes_uploaded += n
+      n = filedata.readinto(block)
     self.stopwatch_stop(bytes_uploaded)
+    if bitstream.length and bytes_uploaded < bitstream.length:
+      print("truncated, %d of %d bytes" % (bytes_uploaded, bitstream.length))
     self.prog_stream_done()
+    return True
 
   def open_file(self, filename, gz=False):
     filedata = open(filename, "rb")
@@ -628,10 +634,8 @@ def prog(filepath, prog_close=True):
   board = artix7()
   filedata, gz = board.filedata_gz(filepath)
   if filedata:
-    if gz:
-      board.prog_stream(filedata,blocksize=4096)
-    else:
-      board.prog_stream(filedata,blocksize=16384)
+    if not board.prog_stream(filedata,blocksize=4096 if gz else 16384):
+      return False
     # NOTE now the SD card can be released before bitstream starts
     if prog_close:
       return board.prog_close() # start the bitstream
@@ -661,8 +665,7 @@ def passthru():
     filepath = "passthru%08x.bit.gz" % idcode
     print("artix7.prog(\"%s\")" % filepath)
     filedata = board.open_file(filepath, gz=True)
-    board.prog_stream(filedata,blocksize=4096)
-    return board.prog_close()
+    return board.prog_stream(filedata,blocksize=4096) and board.prog_close()
   return False
 
 def help():
@@ -0,0 +1 @@
+../bitstream.py
\ No newline at end of file
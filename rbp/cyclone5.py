@@ -391,8 +391,7 @@ class cyclone5:
   # TAP should be in "select DR scan" state
   @micropython.viper
   def flash_open(self):
-    self.prog_stream(self.open_file("bscan7.bit.gz",True))
-    if not self.prog_close():
+    if not (self.prog_stream(self.open_file("bscan7.bit.gz",True)) and self.prog_close()):
       print("bscan7.bit.gz failed")
     self.common_open()
     self.reset_tap()
@@ -468,20 +467,25 @@ class cyclone5:
       transfer_rate_kBps = bytes_uploaded // elapsed_ms
     print("%d bytes uploaded in %d ms (%d kB/s)" % (bytes_uploaded, elapsed_ms, transfer_rate_kBps))
 
+  # first block is checked before programming mode,
+  # returns False if rejected, FPGA keeps running design
   def prog_stream(self, filedata, blocksize=16384):
-    self.prog_open()
+    import bitstream
     bytes_uploaded = 0
     self.stopwatch_start()
     block = bytearray(blocksize)
-    while True:
-      if filedata.readinto(block):
-        #self.reverse_bits(block,blocksize)
-        self.hwspi.write(block)
-        bytes_uploaded += len(block)
-      else:
-        break
+    n = filedata.readinto(block)
+    if not n or not bitstream.cyclone(memoryview(block)[:n], self.idcode()):
+      return False
+    self.prog_open()
+    while n:
+      #self.reverse_bits(block,blocksize)
+      self.hwspi.write(block)
+      bytes_uploaded += n
+      n = filedata.readinto(block)
     self.stopwatch_stop(bytes_uploaded)
     self.prog_stream_done()
+    return True
 
   def open_file(self, filename, gz=False):
     filedata = open(filename, "rb")
@@ -620,10 +624,8 @@ def prog(filepath, prog_close=True):
   board = cyclone5()
   filedata, gz = board.filedata_gz(filepath)
   if filedata:
-    if gz:
-      board.prog_stream(filedata,blocksize=4096)
-    else:
-      board.prog_stream(filedata,blocksize=16384)
+    if not board.prog_stream(filedata,blocksize=4096 if gz else 16384):
+      return False
     # NOTE now the SD card can be released before bitstream starts
     if prog_close:
       return board.prog_close() # start the bitstream
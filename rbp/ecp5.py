@@ -484,19 +484,26 @@ class ecp5:
       transfer_rate_kBps = bytes_uploaded // elapsed_ms
     print("%d bytes uploaded in %d ms (%d kB/s)" % (bytes_uploaded, elapsed_ms, transfer_rate_kBps))
 
+  # first block is checked before programming mode,
+  # returns False if rejected, FPGA keeps running design
   def prog_stream(self, filedata, blocksize=16384):
-    self.prog_open()
+    import bitstream
     bytes_uploaded = 0
     self.stopwatch_start()
     block = bytearray(blocksize)
-    while True:
-      if filedata.readinto(block):
-        self.hwspi.write(block)
-        bytes_uploaded += len(block)
-      else:
-        break
+    n = filedata.readinto(block)
+    if not n or not bitstream.ecp5(memoryview(block)[:n], self.idcode()):
+      return False
+    self.prog_open()
+    while n:
+      self.hwspi.write(block)
+      bytes_uploaded += n
+      n = filedata.readinto(block)
     self.stopwatch_stop(bytes_uploaded)
+    if bitstream.max_length and bytes_uploaded > bitstream.max_length:
+      print("too long, %d bytes, device takes max %d" % (bytes_uploaded, bitstream.max_length))
     self.prog_stream_done()
+    return True
 
   def open_file(self, filename, gz=False):
     filedata = open(filename, "rb")
@@ -642,10 +649,8 @@ def prog(filepath, prog_close=True):
   board = ecp5()
   filedata, gz = board.filedata_gz(filepath)
   if filedata:
-    if gz:
-      board.prog_stream(filedata,blocksize=4096)
-    else:
-      board.prog_stream(filedata,blocksize=16384)
+    if not board.prog_stream(filedata,blocksize=4096 if gz else 16384):
+      return False
     # NOTE now the SD card can be released before bitstream starts
     if prog_close:
       return board.prog_close() # start the bitstream
@@ -675,8 +680,7 @@ def passthru():
     filepath = "passthru%08x.bit.gz" % idcode
     print("ecp5.prog(\"%s\")" % filepath)
     filedata = board.open_file(filepath, gz=True)
-    board.prog_stream(filedata,blocksize=4096)
-    return board.prog_close()
+    return board.prog_stream(filedata,blocksize=4096) and board.prog_close()
   return False
 
 def help():
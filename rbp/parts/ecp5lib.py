@@ -8,11 +8,12 @@ from time import sleep_ms
 from machine import Pin
 from micropython import const
 from struct import pack, unpack
-from uctypes import addressof
 
 import jtag
 from jtag import *
 
+irlen = const(8)
+
 flash_read_size = const(2048)
 flash_write_size = const(256)
 flash_erase_size = const(4096)
@@ -21,18 +22,6 @@ flash_erase_cmd = flash_erase_cmd[flash_erase_size]
 read_status = bytearray([5])
 status = bytearray(1)
 
-def idcode():
-  bitbang_jtag_on()
-  #self.led.on()
-  reset_tap()
-  runtest_idle(1,0)
-  sir(0xE0)
-  id_bytes = bytearray(4)
-  sdr_response(id_bytes)
-  #led.off()
-  bitbang_jtag_off()
-  return unpack("<I", id_bytes)[0]
-
 # common JTAG open for both program and flash
 def common_open():
   jtag_open()
@@ -78,11 +67,6 @@ def prog_open():
   #for byte in block:
   #  send_data_byte_reverse(byte,0)
 
-def prog_stream_done():
-  # switch from hardware SPI to bitbanging done after prog_stream()
-  jtag.hwspi.init(sck=Pin(gpio_tcknc)) # avoid TCK-glitch
-  spi_jtag_off()
-
 # call this after uploading all of the bitstream blocks,
 # this will exit FPGA programming mode and start the bitstream
 # returns status True-OK False-Fail
@@ -115,9 +99,8 @@ def prog_close():
   return done
 
 # call this before sending the flash image
-# FPGA will enter flashing mode
+# FPGA will enter flashing mode, returns True
 # TAP should be in "select DR scan" state
-@micropython.viper
 def flash_open():
   common_open()
   reset_tap()
@@ -129,6 +112,7 @@ def flash_open():
   # 0x60 and other SPI flash commands here are bitreverse() values
   # of flash commands found in SPI FLASH datasheet.
   # e.g. 0x1B here is actually 0xD8 in datasheet, 0x60 is is 0x06 etc.
+  return True
 
 @micropython.viper
 def flash_wait_status(n:int):
@@ -152,14 +136,14 @@ def flash_wait_status(n:int):
   if retry <= 0:
     print("error %d flash status 0x%02X & 0x%02X != 0" % (n,status[0],mask))
 
-def flash_erase_block(addr=0):
+def flash_erase_block(addr=0, cmd=flash_erase_cmd):
   sdr(b"\x60") # SPI WRITE ENABLE
   flash_wait_status(1001)
   # some chips won't clear WIP without this:
   #status = pack("<H",0x00A0) # READ STATUS REGISTER
   #sdr_response(status)
   #check_response(unpack("<H",status)[0],mask=0xC100,expected=0x4000)
-  req = pack(">I", (flash_erase_cmd << 24) | (addr & 0xFFFFFF))
+  req = pack(">I", (cmd << 24) | (addr & 0xFFFFFF))
   send_tms(0) # -> capture DR
   send_tms(0) # -> shift DR
   jtag.swspi.write(req[:-1])
@@ -215,9 +199,3 @@ def flash_close():
   reset_tap()
   #led.off()
   bitbang_jtag_off()
-
-def init():
-  global irlen
-  irlen=8
-
-init()
@@ -4,21 +4,29 @@
 # AUTHOR=EMARD
 # LICENSE=BSD
 
-# choose one:
-#import ecp5lib as spi
-#import artix7lib as spi
-import cyclone5lib as spi
-
-import jtag
 from jtag import *
+import fpga # family driver detected by IDCODE
 
 from uctypes import addressof
 
+# Artix-7 and Cyclone-V access FLASH thru jtagspi bridge
+# bitstream. close=True (default) starts the bitstream
+# from FLASH, so next access loads the bridge again.
+# For several accesses in a row pass close=False to all
+# but the last, bridge is then loaded only once.
+
 # data is bytearray of to-be-read length
-def flash_read(data, addr=0):
-  spi.flash_open()
+# close=False keeps jtagspi bridge for next access
+def flash_read(data, addr=0, close=True):
+  spi = fpga.detect()
+  if not spi:
+    return False
+  if not spi.flash_open():
+    return False
   spi.flash_read_block(data, addr)
-  spi.flash_close()
+  if close:
+    spi.flash_close()
+  return True
 
 # accelerated compare flash and file block
 # return value
@@ -46,10 +54,14 @@ def compare_flash_file_buf(flash_b, file_b, must:int) -> int:
 # needs more buffers: 4K erase block is max that fits on ESP32
 # returns status True-OK False-Fail
 def flash_stream(filedata, addr=0):
-  spi.flash_open()
-  addr_mask = spi.flash_erase_size-1
+  spi = fpga.detect()
+  if not spi:
+    return False
+  if not spi.flash_open():
+    return False
+  addr_mask = fpga.flash_erase_size-1
   if addr & addr_mask:
-    print("addr must be rounded to flash_erase_size = %d bytes (& 0x%06X)" % (spi.flash_erase_size, 0xFFFFFF & ~addr_mask))
+    print("addr must be rounded to flash_erase_size = %d bytes (& 0x%06X)" % (fpga.flash_erase_size, 0xFFFFFF & ~addr_mask))
     return False
   addr = addr & 0xFFFFFF & ~addr_mask # rounded to even 64K (erase block)
   bytes_uploaded = 0
@@ -63,7 +75,7 @@ def flash_stream(filedata, addr=0):
   count_total = 0
   count_erase = 0
   count_write = 0
-  file_block = bytearray(spi.flash_erase_size)
+  file_block = bytearray(fpga.flash_erase_size)
   flash_block = bytearray(spi.flash_read_size)
   progress_char="."
   while filedata.readinto(file_block):
@@ -72,14 +84,14 @@ def flash_stream(filedata, addr=0):
     while retry >= 0:
       must = 0
       flash_rd = 0
-      while flash_rd<spi.flash_erase_size:
+      while flash_rd<fpga.flash_erase_size:
         spi.flash_read_block(flash_block,addr+bytes_uploaded+flash_rd)
         must = compare_flash_file_buf(flash_block,file_block[flash_rd:flash_rd+spi.flash_read_size],must)
         flash_rd+=spi.flash_read_size
       write_addr = addr+bytes_uploaded
       if must == 0:
         if (write_addr & 0xFFFF) == 0:
-          print("\r0x%06X %dK %c" % (write_addr, spi.flash_erase_size>>10, progress_char),end="")
+          print("\r0x%06X %dK %c" % (write_addr, fpga.flash_erase_size>>10, progress_char),end="")
         else:
           print(progress_char,end="")
         progress_char="."
@@ -88,7 +100,7 @@ def flash_stream(filedata, addr=0):
         break
       retry -= 1
       if must & 1: # must_erase:
-        spi.flash_erase_block(write_addr)
+        spi.flash_erase_block(write_addr, fpga.flash_erase_cmd)
         count_erase += 1
         progress_char = "e"
       if must & 2: # must_write:
@@ -109,10 +121,13 @@ def flash_stream(filedata, addr=0):
       break
   print("\r",end="")
   stopwatch_stop(bytes_uploaded)
-  print("%dK blocks: %d total, %d erased, %d written." % (spi.flash_erase_size>>10, count_total, count_erase, count_write))
+  print("%dK blocks: %d total, %d erased, %d written." % (fpga.flash_erase_size>>10, count_total, count_erase, count_write))
   return retry >= 0 # True if successful
 
 def flash(filepath, addr=0, close=True):
+  spi = fpga.detect()
+  if not spi:
+    return False
   filedata, gz = filedata_gz(filepath)
   if filedata:
     status=flash_stream(filedata,addr)
@@ -122,7 +137,7 @@ def flash(filepath, addr=0, close=True):
     return status
   return False
 
-def flashrd(addr=0, length=1):
+def flashrd(addr=0, length=1, close=True):
   data = bytearray(length)
-  flash_read(data, addr)
+  flash_read(data, addr, close)
   return data
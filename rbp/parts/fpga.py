@@ -0,0 +1,107 @@
+# micropython ESP32
+# FPGA family driver selected by IDCODE
+
+# LICENSE=BSD
+
+# proglib and flashlib call family functions
+# thru the driver returned by detect():
+#   import fpga
+#   fpga.detect() # ecp5lib, artix7lib or cyclone5lib
+#   fpga.info()   # attached device and its settings
+# Only detected family driver is imported.
+# Driver module provides irlen, prog_open(), prog_close(),
+# flash_open(), flash_close(), flash_read_block(),
+# flash_write_block(), flash_erase_block(addr, cmd),
+# flash_read/write_size and default flash_erase_size/cmd.
+
+import jtag
+
+# IDCODE manufacturer (bits 11-0) -> family driver
+families = {
+  0x043: "ecp5lib",     # Lattice
+  0x093: "artix7lib",   # Xilinx
+  0x0DD: "cyclone5lib", # Altera
+}
+
+# known devices, IDCODE without version (bits 31-28)
+# except ECP5 where these bits tell device apart.
+# IDCODE -> (name, default FLASH chip)
+devices = {
+  0x21111043: ("LFE5U-12F",    "IS25LP128"),
+  0x41111043: ("LFE5U-25F",    "IS25LP128"),
+  0x41112043: ("LFE5U-45F",    "IS25LP128"),
+  0x41113043: ("LFE5U-85F",    "IS25LP128"),
+  0x01111043: ("LFE5UM-25F",   "IS25LP128"),
+  0x01112043: ("LFE5UM-45F",   "IS25LP128"),
+  0x01113043: ("LFE5UM-85F",   "IS25LP128"),
+  0x81111043: ("LFE5UM5G-25F", "IS25LP128"),
+  0x81112043: ("LFE5UM5G-45F", "IS25LP128"),
+  0x81113043: ("LFE5UM5G-85F", "IS25LP128"),
+  0x0362E093: ("XC7A15T",      "S25FL256S"),
+  0x0362D093: ("XC7A35T",      "S25FL256S"),
+  0x0362C093: ("XC7A50T",      "S25FL256S"),
+  0x03632093: ("XC7A75T",      "S25FL256S"),
+  0x03631093: ("XC7A100T",     "S25FL256S"),
+  0x03636093: ("XC7A200T",     "S25FL256S"),
+  0x02B150DD: ("5CEBA2",       "S25FL256S"),
+  0x02B050DD: ("5CEBA4",       "S25FL256S"),
+  0x02B220DD: ("5CEBA5",       "S25FL256S"),
+  0x02D020DD: ("5CSEBA6",      "S25FL256S"),
+}
+
+# FLASH chip -> (erase block size, erase command)
+# S25FL256S has 4K sectors only at the bottom, 64K erase
+flashes = {
+  "IS25LP128": (4096, 0x20),
+  "S25FL256S": (65536, 0xD8),
+}
+
+# attached FPGA, cached for the session by detect()
+lib = None      # family driver module
+idcode = 0      # as read, with version
+device = None   # devices entry, None if not in table
+flash_erase_size = 4096 # FLASH chip of device or driver default
+flash_erase_cmd = 0x20
+bridge = None   # jtagspi bridge bitstream for FLASH access
+
+# load driver module by name, set its IR length
+def select(name):
+  global lib
+  lib = __import__(name)
+  jtag.irlen = lib.irlen
+  return lib
+
+# driver for attached FPGA, None if not recognized
+# ("unknown IDCODE" is printed, callers return False).
+# IDCODE is read once and device FLASH erase block
+# is set. Set fpga.lib = None after changing FPGA board.
+def detect():
+  global idcode, device, bridge, flash_erase_size, flash_erase_cmd
+  if lib:
+    return lib
+  idcode = jtag.idcode()
+  name = families.get(idcode & 0xFFF)
+  if name is None:
+    print("unknown IDCODE 0x%08X" % idcode)
+    return None
+  select(name)
+  device = devices.get(idcode) or devices.get(idcode & 0x0FFFFFFF)
+  flash_erase_size, flash_erase_cmd = lib.flash_erase_size, lib.flash_erase_cmd
+  if device and device[1] in flashes:
+    flash_erase_size, flash_erase_cmd = flashes[device[1]]
+  if name != "ecp5lib": # ECP5 has SPI FLASH access without bridge
+    bridge = "jtagspi%08x.bit.gz" % idcode
+  return lib
+
+def info():
+  if not detect():
+    return
+  print("IDCODE 0x%08X %s" % (idcode, lib.__name__))
+  if device:
+    print("%s FLASH %s" % device)
+  else:
+    print("not in devices table")
+  print("IR %d bits, TCK %d Hz, FLASH erase %dK cmd 0x%02X" %
+    (jtag.irlen, jtag.spi_freq, flash_erase_size>>10, flash_erase_cmd))
+  if bridge:
+    print("bridge %s" % bridge)
@@ -8,6 +8,7 @@ from time import ticks_ms
 from machine import SPI, Pin
 from micropython import const
 from uctypes import addressof
+from struct import unpack
 
 # FIXME hi-z tcknc
 
@@ -34,7 +35,7 @@ gpio_led = const(19)
 #gpio_led = const(5)
 
 irlen = 8
-spi_freq = const(25000000) # Hz JTAG clk frequency
+spi_freq = 25000000 # Hz JTAG clk frequency
 spi_channel = const(2) # -1 soft, 1:sd, 2:jtag
 
 hwspi=None
@@ -285,6 +286,22 @@ def jtag_open():
   reset_tap()
   runtest_idle(1,0)
 
+# after TAP reset, every FPGA family has IDCODE in DR,
+# so it reads without knowing IR length or instruction
+def idcode():
+  bitbang_jtag_on()
+  reset_tap()
+  runtest_idle(1,0)
+  id_bytes = bytearray(4)
+  sdr_response(id_bytes)
+  bitbang_jtag_off()
+  return unpack("<I", id_bytes)[0]
+
+# switch from hardware SPI to bitbanging done after prog_stream()
+def prog_stream_done():
+  hwspi.init(sck=Pin(gpio_tcknc)) # avoid TCK-glitch
+  spi_jtag_off()
+
 def stopwatch_start():
   global stopwatch_ms
   stopwatch_ms = ticks_ms()
@@ -0,0 +1,189 @@
+# micropython ESP32
+# FLASH thru jtagspi bridge bitstream (USER1)
+
+# AUTHOR=EMARD
+# LICENSE=BSD
+
+# common to artix7lib and cyclone5lib:
+# bridge bitstream "jtagspi%08x.bit.gz" % idcode
+# is loaded to FPGA, then SPI FLASH commands
+# are sent thru USER1 DR.
+# Bridge stays loaded after flash(close=False),
+# next flash_open() finds it running and doesn't
+# load it again. Decompressed copy of bridge is
+# kept in "bridge_cache" directory (SD card),
+# so it is inflated only once.
+
+from time import sleep_ms
+from micropython import const
+
+import jtag
+from jtag import *
+
+flash_read_size = const(2048)
+flash_write_size = const(256)
+flash_erase_size = const(65536)
+flash_erase_cmd = { 4096:0x20, 32768:0x52, 65536:0xD8, 262144:0xD8 } # erase commands from FLASH PDF
+flash_erase_cmd = flash_erase_cmd[flash_erase_size]
+
+magic=bytearray([0x59,0xA6,0x59,0xA6])
+wrenable=magic+bytearray([0,8,6])
+wrdisable=magic+bytearray([0,8,4])
+read_status=magic+bytearray([0,16,5,0])
+status=bytearray(2)
+dummy4=bytearray(4)
+none=bytearray(0)
+read_id=magic+bytearray([0,32,0x9F,0,0,0])
+
+bridge_cache = "/sd/" # directory for decompressed bridge, "" to disable
+
+# USER1 send a+b MSB first
+# a can be 0-size
+def user1_send(a,b):
+  sir(2) # USER1
+  send_tms(0) # -> capture DR
+  send_tms(0) # -> shift DR
+  jtag.swspi.write(a)
+  jtag.swspi.write(b[:-1])
+  send_data_byte_reverse(b[-1],1,8) # last byte -> exit 1 DR
+  send_tms(0) # -> pause DR
+  send_tms(1) # -> exit 2 DR
+  send_tms(1) # -> update DR
+  send_tms(1) # -> select DR scan
+
+# USER1 send a, recv b
+# a can be 0-size
+# after b, it reads one dummy bit
+@micropython.viper
+def user1_send_recv(a,b):
+  sir(2) # USER1
+  send_tms(0) # -> capture DR
+  send_tms(0) # -> shift DR
+  jtag.swspi.write(a)
+  jtag.swspi.readinto(b)
+  send_tms(1) # -> exit 1 DR, dummy bit
+  send_tms(0) # -> pause DR
+  send_tms(1) # -> exit 2 DR
+  send_tms(1) # -> update DR
+
+# True if bridge bitstream is running:
+# FLASH answers JEDEC ID thru USER1.
+# Without bridge USER1 reads all 0 or 1.
+# TAP returns to "select DR scan" state
+def bridge_running():
+  user1_send(none,read_id)
+  id=bytearray(4)
+  user1_send_recv(none,id)
+  reset_tap()
+  runtest_idle(1,0)
+  return id[1] != 0 and id[1] != 0xFF
+
+# copies stream to file while reading
+class tee:
+  def __init__(self, src, dst):
+    self.src = src
+    self.dst = dst
+
+  def readinto(self, buf):
+    n = self.src.readinto(buf)
+    if n:
+      self.dst.write(memoryview(buf)[:n])
+    return n
+
+# bridge bitstream stream, decompressed copy from
+# bridge_cache or .gz which is copied to bridge_cache
+# returns (filedata, gz, copy filename or None)
+def bridge_file(file):
+  if bridge_cache:
+    raw = bridge_cache + file[:-3] # without ".gz"
+    try:
+      return open(raw,"rb"), False, None
+    except OSError:
+      pass
+  filedata = open_file(file,True)
+  if bridge_cache:
+    try:
+      return tee(filedata, open(raw+".tmp","wb")), True, raw
+    except OSError: # no SD card
+      pass
+  return filedata, True, None
+
+# load bridge bitstream unless it is running, then
+# TAP is in "select DR scan" state.
+# returns True-OK False-Fail
+def bridge_open():
+  import proglib, fpga
+  if not fpga.detect():
+    return False
+  jtag_open()
+  if bridge_running():
+    return True
+  spi_jtag_off()
+  bitbang_jtag_off()
+  file=fpga.bridge # named by IDCODE read once per session
+  filedata, gz, raw = bridge_file(file)
+  try:
+    ok = proglib.prog_stream(filedata,blocksize=4096 if gz else 16384)
+  finally:
+    if raw:
+      filedata.dst.close()
+    elif not gz:
+      filedata.close()
+  if raw:
+    import os
+    if ok:
+      os.rename(raw+".tmp", raw)
+      print("%s copied to %s" % (file, raw))
+    else:
+      os.remove(raw+".tmp")
+  if not ok or not proglib.prog_close():
+    print("%s failed" % file)
+    return False
+  jtag_open()
+  return True
+  # ---------- flashing begin -----------
+
+@micropython.viper
+def flash_wait_status(n:int):
+  retry=n
+  while retry > 0:
+    user1_send(none,read_status)
+    user1_send_recv(none,status)
+    if (int(status[1]) & 1) == 0:
+      break
+    sleep_ms(1)
+    retry -= 1
+  if retry <= 0:
+    print("error %d flash status 0x%02X & 1 != 0" % (n,status[1]))
+
+def flash_erase_block(addr=0, cmd=flash_erase_cmd):
+  user1_send(none,wrenable)
+  flash_wait_status(1001)
+  req=magic+bytearray([0,32,cmd,addr>>16,addr>>8,addr]) # 6=SPI WRITE ENABLE
+  user1_send(none,req)
+  flash_wait_status(2002)
+
+def flash_write_block(block, addr=0):
+  user1_send(none,wrenable)
+  flash_wait_status(114)
+  # 6 = SPI WRITE ENABLE, 2 = WRITE BLOCK followed by 3-byte address and 256-byte data block
+  bits=(4+len(block))*8
+  req=magic+bytearray([bits>>8,bits,2,addr>>16,addr>>8,addr])
+  user1_send(req,block)
+  flash_wait_status(1004)
+
+# data is bytearray of to-be-read length
+# max 2048 bytes
+def flash_read_block(data, addr=0):
+  # first is the request 3=READ BLOCK, 3-byte address, 256-byte data
+  bits=(len(data)+4)*8
+  req=magic+bytearray([bits>>8,bits,3,addr>>16,addr>>8,addr])
+  user1_send(req,data)
+  # collects response from previous command
+  user1_send_recv(dummy4,data)
+
+# FLASH write disable, then family
+# flash_close() reconfigures FPGA
+def bridge_close():
+  user1_send(none,wrdisable)
+  # ---------- flashing end -----------
@@ -4,37 +4,55 @@
 # AUTHOR=EMARD
 # LICENSE=BSD
 
-# choose one:
-#import ecp5lib as fpga
-#import artix7lib as fpga
-import cyclone5lib as fpga
-
 import jtag
 from jtag import *
+import fpga # family driver detected by IDCODE
+
+# family driver -> header check in bitstream.py
+checks = { "ecp5lib":"ecp5", "artix7lib":"xilinx", "cyclone5lib":"cyclone" }
 
+# first block is checked before programming mode,
+# returns False if rejected, FPGA keeps running design
 def prog_stream(filedata, blocksize=4096):
-  fpga.prog_open()
+  import bitstream
+  drv = fpga.detect()
+  if not drv:
+    return False
   bytes_uploaded = 0
   stopwatch_start()
   block = bytearray(blocksize)
-  while True:
-    if filedata.readinto(block):
-      jtag.hwspi.write(block)
-      bytes_uploaded += len(block)
-    else:
-      break
+  n = filedata.readinto(block)
+  check = getattr(bitstream, checks[drv.__name__])
+  if not n or not check(memoryview(block)[:n], fpga.idcode):
+    return False
+  drv.prog_open()
+  while n:
+    jtag.hwspi.write(block)
+    bytes_uploaded += n
+    n = filedata.readinto(block)
   stopwatch_stop(bytes_uploaded)
-  fpga.prog_stream_done()
+  if bitstream.length and bytes_uploaded < bitstream.length:
+    print("truncated, %d of %d bytes" % (bytes_uploaded, bitstream.length))
+  if bitstream.max_length and bytes_uploaded > bitstream.max_length:
+    print("too long, %d bytes, device takes max %d" % (bytes_uploaded, bitstream.max_length))
+  prog_stream_done()
+  return True
+
+# exit programming mode and start the bitstream
+# returns status True-OK False-Fail
+def prog_close():
+  drv = fpga.detect()
+  if not drv:
+    return False
+  return drv.prog_close()
 
 def prog(filepath, close=True):
   filedata, gz = filedata_gz(filepath)
   if filedata:
-    if gz:
-      prog_stream(filedata,blocksize=4096)
-    else:
-      prog_stream(filedata,blocksize=16384)
+    if not prog_stream(filedata,blocksize=4096 if gz else 16384):
+      return False
     # NOTE now the SD card can be released before bitstream starts
     if close:
-      return fpga.prog_close() # start the bitstream
+      return prog_close() # start the bitstream
     return True
   return False
@@ -7,6 +7,92 @@
 from time import ticks_ms
 from machine import SPI, Pin, SDCard
 from micropython import const
+from uctypes import addressof
+try:
+  import _thread
+except ImportError:
+  _thread = None
+
+# bytes per SD write, two such buffers are used
+# (three with compare). Largest is used only if it
+# takes at most 1/4 of free RAM (WROVER), else smaller
+_WRITE_SIZE = const(32768)
+_WRITE_SIZE_MIN = const(4096)
+_WRITE_SIZE_GZ = const(8192) # uzlib needs 32K window too
+
+# write block size which fits in free RAM
+def write_size(buffers=2, limit=_WRITE_SIZE):
+  from gc import collect, mem_free
+  collect()
+  size = limit
+  while size > _WRITE_SIZE_MIN and size*buffers > mem_free()//4:
+    size >>= 1
+  return size
+
+# 1 if all bytes are zero, len multiple of 4
+@micropython.viper
+def zero(buf)->int:
+  p = ptr32(addressof(buf))
+  for i in range(int(len(buf))>>2):
+    if p[i]:
+      return 0
+  return 1
+
+# first sector from i, where buffers a and b differ (equal=0)
+# or are equal (equal=1), n if none. 512-byte sectors
+@micropython.viper
+def next_sector(a, b, i:int, n:int, equal:int)->int:
+  pa = ptr32(addressof(a))
+  pb = ptr32(addressof(b))
+  while i < n:
+    j = i << 7 # 128 words per sector
+    e = 1
+    for k in range(128):
+      if pa[j+k] != pb[j+k]:
+        e = 0
+        break
+    if e == equal:
+      return i
+    i += 1
+  return n
+
+# lines of text stream, without "\n"
+def lines(filedata):
+  buf = bytearray(512)
+  rest = b""
+  while True:
+    n = filedata.readinto(buf)
+    if not n:
+      break
+    parts = (rest + bytes(buf[:n])).split(b"\n")
+    rest = parts.pop()
+    for line in parts:
+      yield line
+  if rest:
+    yield rest
+
+# bmaptool block map, mapped ranges of the image
+# returns list of (byte offset, byte length)
+def read_bmap(filedata):
+  blocksize = 4096
+  imagesize = None
+  ranges = []
+  for line in lines(filedata):
+    line = line.decode().strip()
+    if line.startswith("<ImageSize>"):
+      imagesize = int(line[11:line.find("<",11)])
+    elif line.startswith("<BlockSize>"):
+      blocksize = int(line[11:line.find("<",11)])
+    elif line.startswith("<Range"):
+      blocks = line[line.find(">")+1:line.rfind("<")].split("-")
+      first = int(blocks[0])
+      last = int(blocks[-1])
+      start = first*blocksize
+      length = (last-first+1)*blocksize
+      if imagesize is not None and start+length > imagesize:
+        length = imagesize-start
+      ranges.append((start, length))
+  return ranges
 
 class sdraw:
   #def __init__(self):
@@ -30,27 +116,20 @@ class sdraw:
       return uzlib.DecompIO(filedata,31)
     return filedata
 
+  # HTTP/1.1 with keep-alive, see httpclient.py
   def open_web(self, url, gz=False):
-    import socket
-    _, _, host, path = url.split('/', 3)
-    port = 80
-    if ( len(host.split(':')) == 2 ):
-      host, port = host.split(':', 2)
-    print("host = ",host," port = ", port, " path = ", path)
-    addr = socket.getaddrinfo(host, port)[0][-1]
-    s = socket.socket()
-    s.connect(addr)
-    s.send(bytes('GET /%s HTTP/1.0\r\nHost: %s\r\nAccept:  image/*\r\n\r\n' % (path, host), 'utf8'))
-    for i in range(100): # read first 100 lines searching for
-      if len(s.readline()) < 3: # first empty line (contains "\r\n")
-        break
-    if gz:
-      import uzlib
-      return uzlib.DecompIO(s,31)
-    return s
+    import httpclient
+    return httpclient.open_url(url, gz)
 
   def sd_open(self):
     self.sd = SDCard(slot=3)
+    self.cardsize = None
+
+  # bytes, asked from the card once per sd_open()
+  def sd_size(self):
+    if self.cardsize is None:
+      self.cardsize = self.sd.ioctl(4,0)*0x200
+    return self.cardsize
 
   def sd_close(self):
     self.sd.deinit()
@@ -70,8 +149,7 @@ class sdraw:
   def sd_wrapaddr(self, addr):
     if addr >= 0:
       return addr
-    cardsize = self.sd.ioctl(4,0)*0x200
-    return cardsize+addr
+    return self.sd_size()+addr
 
   def sd_read(self, data, addr=0):
     if not self.sd_check_param(addr) or not self.sd_check_param(len(data)):
@@ -81,28 +159,208 @@ class sdraw:
     self.sd_close()
     return True
 
-  def sd_write_stream(self, filedata, addr=0, blocksize=16384):
+  # read SD first and write only runs of sectors which differ
+  # returns number of bytes not written
+  def sd_compare_write(self, block, old, waddr):
+    self.sd.readblocks(waddr//0x200, old)
+    mv = memoryview(block)
+    n = len(block) >> 9
+    written = 0
+    i = next_sector(block, old, 0, n, 0)
+    while i < n:
+      j = next_sector(block, old, i, n, 1)
+      self.sd.writeblocks(waddr//0x200+i, mv[i<<9:j<<9])
+      written += j-i
+      i = next_sector(block, old, j, n, 0)
+    return (n-written) << 9
+
+  # write n bytes of block to SD, runs in writer thread
+  def sd_put(self, block, n, waddr):
+    t = ticks_ms()
+    mv = memoryview(block)[:n]
+    if self.sparse and zero(mv):
+      self.skipped += n
+    elif self.old is not None:
+      self.skipped += self.sd_compare_write(mv, memoryview(self.old)[:n], waddr)
+    else:
+      self.sd.writeblocks(waddr//0x200, mv)
+    self.ms_write += ticks_ms()-t
+
+  # writer thread, takes jobs (block, n, waddr) until None
+  def sd_writer(self):
+    while True:
+      self.start.acquire()
+      job = self.job
+      if job is None:
+        break
+      try:
+        self.sd_put(*job)
+      except Exception as e:
+        self.error = e
+      self.done.release()
+    self.done.release()
+
+  # sparse: all-zero blocks are not written, SD keeps old content there
+  # compare: sectors already on SD are not written, like flash_stream()
+  # Two buffers: while one is written to SD in writer thread,
+  # the next is read from filedata, so WiFi and SD wait in parallel.
+  # blocksize None: from free RAM, see write_size()
+  def sd_write_stream(self, filedata, addr=0, blocksize=None, sparse=False, compare=False):
     if not self.sd_check_param(addr):
       return False
+    if blocksize is None:
+      blocksize = write_size(3 if compare else 2)
     bytes_uploaded = 0
     self.sd_open()
     addr=self.sd_wrapaddr(addr)
-    nearend=self.sd_wrapaddr(-blocksize)
+    end=self.sd_size()
+    self.sparse = sparse
+    self.old = bytearray(blocksize) if compare else None
+    self.skipped = 0
+    self.ms_write = 0
+    self.error = None
+    ms_read = 0
+    ms_wait = 0
+    buf = (bytearray(blocksize), bytearray(blocksize))
+    if _thread:
+      self.start = _thread.allocate_lock()
+      self.start.acquire()
+      self.done = _thread.allocate_lock()
+      _thread.start_new_thread(self.sd_writer, ())
     self.stopwatch_start()
-    block = bytearray(blocksize)
-    while True:
-      waddr=addr+bytes_uploaded
-      if waddr >= nearend and len(block) > 0x200:
-        block = bytearray(0x200)
-      if filedata.readinto(block):
-        self.sd.writeblocks(waddr//0x200,block)
-        bytes_uploaded += len(block)
-      else:
-        break
+    i = 0
+    try:
+      while not self.error:
+        waddr=addr+bytes_uploaded
+        block = buf[i]
+        t = ticks_ms()
+        n = filedata.readinto(block)
+        ms_read += ticks_ms()-t
+        if not n:
+          break
+        k = n
+        n = (k+0x1FF) & ~0x1FF
+        block[k:n] = bytes(n-k) # not previous block's data
+        if n > end-waddr: # image doesn't fit, write what fits
+          n = end-waddr
+          self.error = "end of SD card"
+          if n <= 0:
+            break
+        if _thread:
+          t = ticks_ms()
+          self.done.acquire() # previous block written
+          ms_wait += ticks_ms()-t
+          self.job = (block, n, waddr)
+          self.start.release()
+        else:
+          self.sd_put(block, n, waddr)
+        bytes_uploaded += n
+        i ^= 1
+    finally:
+      # also when readinto() raised: stop writer, release SD
+      if _thread:
+        self.done.acquire() # last block written
+        self.job = None
+        self.start.release()
+        self.done.acquire() # writer finished
+      self.old = None
+      self.sd_close()
     self.stopwatch_stop(bytes_uploaded)
-    self.sd_close()
+    print("read %d ms, write %d ms, wait for write %d ms" % (ms_read, self.ms_write, ms_wait))
+    if sparse or compare:
+      print("%d sectors written, %d skipped" % ((bytes_uploaded-self.skipped)>>9, self.skipped>>9))
+    if self.error:
+      print(self.error)
+      return False
+    return True
+
+  # write length bytes from filedata to SD byte address waddr
+  # returns False if filedata ends before
+  def sd_write_part(self, filedata, waddr, length, block):
+    mv = memoryview(block)
+    while length > 0:
+      want = min(length, len(block))
+      k = filedata.readinto(mv[:want])
+      if not k:
+        return False
+      n = (k+0x1FF) & ~0x1FF
+      block[k:n] = bytes(n-k) # not previous block's data
+      self.sd_put(block, n, waddr)
+      waddr += n
+      length -= n
+      if k < want:
+        break
     return True
 
+  # write only mapped ranges of the image, rest of SD is not touched.
+  # Web file: each range is fetched with HTTP Range request,
+  # local file: seek. ".gz" is decompressed and unmapped data discarded.
+  # sparse and compare as in sd_write_stream()
+  def sd_write_map(self, filepath, ranges, addr=0, blocksize=None, sparse=False, compare=False):
+    if not self.sd_check_param(addr):
+      return False
+    if blocksize is None:
+      blocksize = write_size(2 if compare else 1)
+    gz = filepath.endswith(".gz")
+    web = filepath.startswith("http://") or filepath.startswith("/http:/")
+    filedata = None
+    if gz or not web:
+      filedata = self.open_file(filepath, gz) if not web else self.open_web(filepath, gz)
+      if not filedata:
+        return False
+    bytes_uploaded = 0
+    pos = 0 # position in filedata
+    ok = True
+    self.sd_open()
+    addr = self.sd_wrapaddr(addr)
+    self.sparse = sparse
+    self.old = bytearray(blocksize) if compare else None
+    self.skipped = 0
+    self.ms_write = 0
+    self.stopwatch_start()
+    block = bytearray(blocksize)
+    try:
+      for start, length in ranges:
+        if web and not gz:
+          import httpclient
+          end = start+length-1
+          r = httpclient.get(filepath, "Range: bytes=%d-%d\r\n" % (start, end))
+          if r.status != 206:
+            print("HTTP %d, Range requests not supported" % r.status)
+            r.close()
+            ok = False
+            break
+          src = httpclient.resumable(filepath, r, start, end)
+        elif gz:
+          while pos < start: # discard unmapped
+            n = filedata.readinto(memoryview(block)[:min(start-pos, blocksize)])
+            if not n:
+              break
+            pos += n
+          src = filedata
+        else:
+          filedata.seek(start)
+          src = filedata
+        try:
+          ok = self.sd_write_part(src, addr+start, length, block)
+        finally:
+          if web and not gz:
+            src.close()
+        pos = start+length
+        bytes_uploaded += length
+        if not ok:
+          print("image ends at 0x%X" % start)
+          break
+    finally:
+      # also when HTTP or readinto() raised: release SD
+      self.old = None
+      self.sd_close()
+    self.stopwatch_stop(bytes_uploaded)
+    print("%d ranges, %d bytes mapped" % (len(ranges), bytes_uploaded))
+    if sparse or compare:
+      print("%d sectors written, %d skipped" % ((bytes_uploaded-self.skipped)>>9, self.skipped>>9))
+    return ok
+
 def read(addr=0, length=512):
   data = bytearray(length)
   if sdraw().sd_read(data, addr):
@@ -110,21 +368,35 @@ def read(addr=0, length=512):
   else:
     return False
 
-def write(filepath, addr=0):
+def open_path(filepath):
   gz=filepath.endswith(".gz")
   if filepath.startswith("http://") or filepath.startswith("/http:/"):
-    filedata = sdraw().open_web(filepath, gz)
-  else:
-    filedata = sdraw().open_file(filepath, gz)
+    return sdraw().open_web(filepath, gz), gz
+  return sdraw().open_file(filepath, gz), gz
+
+# bmap: block map file from bmaptool or tools/sdbmap.py,
+#       only mapped blocks are transferred and written
+# sparse: all-zero blocks are not written
+# compare: only sectors which differ from SD are written
+def write(filepath, addr=0, bmap=None, sparse=False, compare=False):
+  if bmap:
+    mapdata, gz = open_path(bmap)
+    if not mapdata:
+      return False
+    ranges = read_bmap(mapdata)
+    mapdata.close()
+    return sdraw().sd_write_map(filepath, ranges, addr, sparse=sparse, compare=compare)
+  filedata, gz = open_path(filepath)
   if filedata:
-    if gz:
-      return sdraw().sd_write_stream(filedata,addr,blocksize=4096)
-    else:
-      return sdraw().sd_write_stream(filedata,addr,blocksize=16384)
+    return sdraw().sd_write_stream(filedata,addr,
+      blocksize=_WRITE_SIZE_GZ if gz else None,sparse=sparse,compare=compare)
   return False
 
 def help():
   print("usage:")
   print("sdraw.write(\"http://192.168.4.2/sdcard.img\", addr=0) # to start of SD")
+  print("sdraw.write(\"http://192.168.4.2/sdcard.img\", bmap=\"http://192.168.4.2/sdcard.bmap\")")
+  print("sdraw.write(\"sdcard.img.gz\", sparse=True) # zero blocks not written")
+  print("sdraw.write(\"sdcard.img.gz\", compare=True) # changed sectors written")
   print("sdraw.read(addr=0, length=512) # from start of SD")
   print("sdraw.read(-1024) # from 1024 bytes before end of SD")
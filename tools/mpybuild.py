@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+# cross-compile modules to .mpy with mpy-cross, so ESP32 imports
+# bytecode instead of compiling source at every import: faster
+# import and no compiler heap peak. mpy-cross is not part of
+# this repository, install it from PyPI:
+#   pip install mpy-cross
+# its version must match the firmware bytecode version
+# (pip install mpy-cross==<firmware version>).
+# -march=xtensawin keeps @micropython.viper functions native.
+# Optionally writes manifest.py to freeze modules into firmware,
+# where they need no filesystem and no RAM for bytecode.
+
+# usage:
+# mpybuild.py [-o mpy] [-march xtensawin] [-manifest manifest.py] [files.py]
+# then upload mpy/*.mpy to ESP32 root instead of *.py,
+# bench_import.py compares both
+
+import sys
+import os
+import shutil
+import subprocess
+
+root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# imported modules, boot.py and main.py must stay source
+modules = [
+  "ecp5.py", "ecp5flash.py", "uftpd.py", "httpclient.py", "gzhdr.py", "webcache.py",
+  "bitstream.py", "sdraw.py", "multiboot.py", "wifiman.py",
+]
+
+def mpy_cross():
+  exe = shutil.which("mpy-cross")
+  if exe:
+    return [exe]
+  try:
+    import mpy_cross
+  except ImportError:
+    print("mpy-cross not found, pip install mpy-cross", file=sys.stderr)
+    sys.exit(1)
+  return [sys.executable, "-m", "mpy_cross"]
+
+def build(files, outdir, march):
+  cmd = mpy_cross()
+  os.makedirs(outdir, exist_ok=True)
+  total_py = 0
+  total_mpy = 0
+  for name in files:
+    src = os.path.join(root, name)
+    out = os.path.join(outdir, os.path.splitext(os.path.basename(name))[0] + ".mpy")
+    subprocess.run(cmd + ["-march=" + march, "-s", os.path.basename(name), "-o", out, src], check=True)
+    size_py = os.path.getsize(src)
+    size_mpy = os.path.getsize(out)
+    total_py += size_py
+    total_mpy += size_mpy
+    print("%-16s %6d -> %6d bytes" % (name, size_py, size_mpy))
+  print("%-16s %6d -> %6d bytes" % ("total", total_py, total_mpy))
+
+# for "make FROZEN_MANIFEST=..." in micropython/ports/esp32
+def manifest(files, filename):
+  with open(filename, "w") as f:
+    f.write('include("$(PORT_DIR)/boards/manifest.py")\n')
+    f.write('freeze("%s", (\n' % root)
+    for name in files:
+      f.write('  "%s",\n' % name)
+    f.write('))\n')
+  print("manifest %s" % filename)
+
+if __name__ == "__main__":
+  outdir = os.path.join(root, "mpy")
+  march = "xtensawin"
+  manifest_file = None
+  files = []
+  args = sys.argv[1:]
+  while args:
+    arg = args.pop(0)
+    if arg == "-o":
+      outdir = args.pop(0)
+    elif arg == "-march":
+      march = args.pop(0)
+    elif arg == "-manifest":
+      manifest_file = args.pop(0)
+    else:
+      files.append(arg)
+  files = files or modules
+  build(files, outdir, march)
+  if manifest_file:
+    manifest(files, manifest_file)
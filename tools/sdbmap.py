@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# create block map (bmaptool format) of SD card image,
+# listing blocks which are not all zero. With it
+# sdraw.write() transfers and writes only those blocks.
+
+# usage sdbmap.py sdcard.img sdcard.bmap [blocksize]
+
+import sys
+import os
+import hashlib
+
+def mapped_ranges(f, blocksize):
+  ranges = []
+  zero = bytes(blocksize)
+  i = 0
+  first = None
+  while True:
+    block = f.read(blocksize)
+    if not block:
+      break
+    if block == zero[:len(block)]:
+      if first is not None:
+        ranges.append((first, i-1))
+        first = None
+    elif first is None:
+      first = i
+    i += 1
+  if first is not None:
+    ranges.append((first, i-1))
+  return ranges, i
+
+def range_sha256(f, blocksize, first, last):
+  h = hashlib.sha256()
+  f.seek(first*blocksize)
+  remain = (last-first+1)*blocksize
+  while remain > 0:
+    data = f.read(min(remain, 1 << 20))
+    if not data:
+      break
+    h.update(data)
+    remain -= len(data)
+  return h.hexdigest()
+
+def bmap(image, blocksize=4096):
+  imagesize = os.path.getsize(image)
+  with open(image, "rb") as f:
+    ranges, blocks = mapped_ranges(f, blocksize)
+    mapped = sum(last-first+1 for first, last in ranges)
+    text = '<?xml version="1.0" ?>\n'
+    text += '<bmap version="2.0">\n'
+    text += '    <ImageSize> %d </ImageSize>\n' % imagesize
+    text += '    <BlockSize> %d </BlockSize>\n' % blocksize
+    text += '    <BlocksCount> %d </BlocksCount>\n' % blocks
+    text += '    <MappedBlocksCount> %d </MappedBlocksCount>\n' % mapped
+    text += '    <ChecksumType> sha256 </ChecksumType>\n'
+    text += '    <BmapFileChecksum> %s </BmapFileChecksum>\n' % ("0" * 64)
+    text += '    <BlockMap>\n'
+    for first, last in ranges:
+      blocks_text = "%d" % first if first == last else "%d-%d" % (first, last)
+      text += '        <Range chksum="%s"> %s </Range>\n' % (range_sha256(f, blocksize, first, last), blocks_text)
+    text += '    </BlockMap>\n'
+    text += '</bmap>\n'
+  # file checksum is calculated with its own field zeroed
+  checksum = hashlib.sha256(text.encode()).hexdigest()
+  text = text.replace("0" * 64, checksum, 1)
+  print("%d of %d blocks mapped" % (mapped, blocks), file=sys.stderr)
+  return text
+
+if __name__ == "__main__":
+  blocksize = int(sys.argv[3]) if len(sys.argv) > 3 else 4096
+  with open(sys.argv[2], "w") as f:
+    f.write(bmap(sys.argv[1], blocksize))
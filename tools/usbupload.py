@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+# host side of circuitpython/usbprog.py, upload to ESP32-S2
+# over USB CDC data channel (second ttyACM), no WiFi.
+# ".gz" files are decompressed here.
+
+# usage:
+# usbupload.py /dev/ttyACM1 prog blink.bit
+# usbupload.py /dev/ttyACM1 flash 0x000000 blink.bit
+# usbupload.py /dev/ttyACM1 sdraw 0 sdcard.img.gz
+# usbupload.py /dev/ttyACM1 read 0x000000 0x10000 dump.bin
+# usbupload.py emulate ...  # pty pair with RAM device instead of ttyACM
+# usbupload.py selftest [loss] # emulated flash, read back and compare,
+#                            # loss: probability of corrupt frame
+
+import sys
+import os
+import io
+import gzip
+import time
+import random
+import select
+import threading
+import tty
+from struct import pack
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "circuitpython"))
+import usbprog
+from usbprog import CMD, ACK, RESULT, send_frame, send_acked, send_stream, read_frame, rx_stream
+
+# raw tty file descriptor with read timeout,
+# as usb_cdc.Serial on device
+class tty_port:
+
+  def __init__(self, fd, timeout=0.05):
+    self.fd = fd
+    self.timeout = timeout
+    if os.isatty(fd):
+      tty.setraw(fd)
+
+  def read(self, n):
+    r, _, _ = select.select([self.fd], [], [], self.timeout)
+    if not r:
+      return b""
+    return os.read(self.fd, n)
+
+  def write(self, data):
+    mv = memoryview(data)
+    while mv:
+      mv = mv[os.write(self.fd, mv):]
+
+# corrupts written frames with probability loss,
+# to exercise NAK and resend
+class lossy_port(tty_port):
+
+  def __init__(self, fd, loss):
+    tty_port.__init__(self, fd)
+    self.loss = loss
+
+  def write(self, data):
+    if random.random() < self.loss:
+      data = bytearray(data)
+      data[random.randrange(len(data))] ^= 0xFF
+    tty_port.write(self, data)
+
+# RAM FPGA, FLASH and SD for emulated device
+class emulated:
+
+  def __init__(self):
+    self.bitstream = b""
+    self.flash_mem = bytearray(b"\xFF" * (4 << 20))
+    self.sd = bytearray(16 << 20)
+
+  def store(self, stream, mem, addr):
+    block = bytearray(4096)
+    while True:
+      n = stream.readinto(block)
+      if not n:
+        return True
+      mem[addr:addr+n] = block[:n]
+      addr += n
+
+  def prog(self, stream):
+    data = io.BytesIO()
+    block = bytearray(4096)
+    while True:
+      n = stream.readinto(block)
+      if not n:
+        break
+      data.write(block[:n])
+    self.bitstream = data.getvalue()
+    return len(self.bitstream) > 0
+
+  def flash(self, stream, addr):
+    return self.store(stream, self.flash_mem, addr)
+
+  def sdraw(self, stream, addr):
+    return self.store(stream, self.sd, addr)
+
+  def read(self, addr, length):
+    return io.BytesIO(self.flash_mem[addr:addr+length])
+
+  def target(self):
+    return { "P":self.prog, "F":self.flash, "S":self.sdraw, "R":self.read }
+
+# pty pair, device served in background thread
+def emulate(loss=0.0):
+  master, slave = os.openpty()
+  tty.setraw(slave)
+  device = emulated()
+  threading.Thread(target=usbprog.serve, daemon=True,
+    args=(lossy_port(slave, loss), device.target())).start()
+  return lossy_port(master, loss), device
+
+def open_port(path):
+  return tty_port(os.open(path, os.O_RDWR | os.O_NOCTTY))
+
+def open_file(filename):
+  if filename.endswith(".gz"):
+    return gzip.open(filename, "rb")
+  return open(filename, "rb")
+
+# counts bytes passed to send_stream()
+class counter:
+
+  def __init__(self, filedata):
+    self.filedata = filedata
+    self.bytes = 0
+
+  def readinto(self, buf):
+    n = self.filedata.readinto(buf)
+    self.bytes += n
+    return n
+
+def command(port, cmd, *args):
+  while port.read(4096): # answers to previous command repeated
+    pass
+  payload = cmd.encode() + pack("<%dI" % len(args), *args)
+  if not send_acked(port, CMD, 0, payload):
+    print("device not responding")
+    return False
+  return True
+
+def report(nbytes, start):
+  ms = int((time.time()-start)*1000)
+  print("%d bytes in %d ms (%d kB/s)" % (nbytes, ms, nbytes//max(ms, 1)))
+
+# send file for cmd, returns True if device reports OK
+def upload(port, cmd, filedata, *args):
+  if not command(port, cmd, *args):
+    return False
+  start = time.time()
+  source = counter(filedata)
+  result = send_stream(port, source)
+  report(source.bytes, start)
+  for i in range(usbprog.retries):
+    if result is not None:
+      break
+    frame = read_frame(port)
+    if frame and frame[0] == RESULT:
+      result = frame[2]
+  if result is not None:
+    send_frame(port, ACK, 0)
+  return result == b"\x01"
+
+def download(port, addr, length, out):
+  if not command(port, "R", addr, length):
+    return False
+  start = time.time()
+  stream = rx_stream(port)
+  block = bytearray(4096)
+  nbytes = 0
+  while True:
+    n = stream.readinto(block)
+    if not n:
+      break
+    out.write(block[:n])
+    nbytes += n
+  report(nbytes, start)
+  if stream.error:
+    print("transfer %s" % stream.error)
+    return False
+  return nbytes == length
+
+def run(port, argv):
+  cmd = argv[0]
+  if cmd == "prog":
+    with open_file(argv[1]) as f:
+      return upload(port, "P", f)
+  if cmd == "flash":
+    with open_file(argv[2]) as f:
+      return upload(port, "F", f, int(argv[1], 0))
+  if cmd == "sdraw":
+    with open_file(argv[2]) as f:
+      return upload(port, "S", f, int(argv[1], 0))
+  if cmd == "read":
+    with open(argv[3], "wb") as f:
+      return download(port, int(argv[1], 0), int(argv[2], 0), f)
+  print("unknown command %s" % cmd)
+  return False
+
+def selftest(loss):
+  usbprog.timeout = 0.2
+  port, device = emulate(loss)
+  data = os.urandom(300000)
+  ok = upload(port, "F", io.BytesIO(data), 0x10000)
+  ok = ok and device.flash_mem[0x10000:0x10000+len(data)] == data
+  out = io.BytesIO()
+  ok = ok and download(port, 0x10000, len(data), out) and out.getvalue() == data
+  ok = ok and upload(port, "P", io.BytesIO(data[:100000])) and device.bitstream == data[:100000]
+  print("selftest %s" % ("OK" if ok else "FAIL"))
+  return ok
+
+if __name__ == "__main__":
+  if sys.argv[1] == "selftest":
+    ok = selftest(float(sys.argv[2]) if len(sys.argv) > 2 else 0.0)
+  else:
+    if sys.argv[1] == "emulate":
+      port, device = emulate()
+    else:
+      usbprog.timeout = 1.0 # FLASH erase and write keeps device busy
+      port = open_port(sys.argv[1])
+    ok = run(port, sys.argv[2:])
+  sys.exit(0 if ok else 1)
@@ -31,6 +31,11 @@ _SO_REGISTER_HANDLER = const(20)
 _COMMAND_TIMEOUT = const(300)
 _DATA_TIMEOUT = const(100)
 _DATA_PORT = const(13333)
+_PATTERN_CACHE = const(8)
+_LIST_BUFFER = const(1024)
+_LIST_NAMES = const(0)
+_LIST_LONG = const(1)
+_LIST_MLSD = const(2)
 
 # Global variables
 ftpsocket = None
@@ -38,6 +43,9 @@ datasocket = None
 client_list = []
 verbose_l = 0
 client_busy = False
+# False: LIST and MLSD skip uos.stat() and file dates,
+# using only uos.ilistdir() type and size, faster on big SD cards
+list_stat = True
 # Interfaces: (IP-Address (string), IP-Address (integer), Netmask (integer))
 AP_addr = ("0.0.0.0", 0, 0xffffff00)
 STA_addr = ("0.0.0.0", 0, 0xffffff00)
@@ -59,6 +67,10 @@ class FTP_client:
     self.command_client.sendall("220 Hello, this is the ULX3S.\r\n")
     self.cwd = '/'
     self.fromname = None
+    self.rest = 0  # REST offset for the next RETR/STOR
+    self.patterns = {}  # fncmp() cache of compiled patterns
+    self.listbuf = None  # send_buffer for directory listings
+    self.vsinks = {}  # registered sink: this session's copy
     # self.logged_in = False
     self.act_data_addr = self.remote_addr
     self.DATA_PORT = 20
@@ -79,51 +91,98 @@ class FTP_client:
     else:
         self.pasv_data_addr = "0.0.0.0"  # Invalid value
 
-  def send_list_data(self, path, data_client, full):
+  # like vpath(), returns this session's copy of the sink
+  def vpath(self, path):
+    sink, arg = vpath(path)
+    if sink:
+      own = self.vsinks.get(sink)
+      if own is None:
+        own = sink.__class__()
+        self.vsinks[sink] = own
+      sink = own
+    return sink, arg
+
+  # mode: _LIST_NAMES for NLST, _LIST_LONG for LIST, _LIST_MLSD
+  def send_list_data(self, path, data_client, mode):
+    if self.listbuf is None:
+      self.listbuf = send_buffer(_LIST_BUFFER)
+    out = self.listbuf
+    out.sock = data_client
+    year = localtime()[0]  # current year, for "ls -l" date format
+    sink, arg = self.vpath(path)
+    if sink:
+      size = sink.stat(path, arg)
+      out.write(self.make_description(self.split_path(path)[1], False,
+        0 if size is None else size, None, mode, year))
+      out.flush()
+      return
+    pattern = None
     try:
-      for fname in uos.listdir(path):
-        data_client.sendall(self.make_description(path, fname, full))
+      entries = uos.ilistdir(path)
     except:  # path may be a file name or pattern
       path, pattern = self.split_path(path)
       try:
-        for fname in uos.listdir(path):
-          if self.fncmp(fname, pattern):
-            data_client.sendall(
-              self.make_description(path, fname, full))
+        entries = uos.ilistdir(path)
       except:
-          pass
-
-  def make_description(self, path, fname, full):
-    global _month_name
-    if full:
+        return
+    try:
+      for entry in entries:
+        if pattern is None or self.fncmp(entry[0], pattern):
+          out.write(self.entry_description(path, entry, mode, year))
+    finally:
+      out.flush()
+      out.sock = None
+
+  # entry from uos.ilistdir(): (name, type, inode[, size])
+  # uos.stat() is called only when needed for date or size
+  def entry_description(self, path, entry, mode, year):
+    fname = entry[0]
+    if mode == _LIST_NAMES:
+      return fname + "\r\n"
+    size = entry[3] if len(entry) > 3 else None
+    mtime = None
+    if list_stat or size is None:
       stat = uos.stat(self.get_absolute_path(path, fname))
-      file_permissions = ("drwxr-xr-x"
-                          if (stat[0] & 0o170000 == 0o040000)
-                          else "-rw-r--r--")
-      file_size = stat[6]
-      tm = localtime(stat[7])
-      if tm[0] != localtime()[0]:
-        description = "{} 1 owner group {:>10} {} {:2} {:>5} {}\r\n".\
-          format(file_permissions, file_size,
-                 _month_name[tm[1]], tm[2], tm[0], fname)
+      size = stat[6]
+      mtime = stat[7]
+    return self.make_description(fname, entry[1] == 0o040000,
+                                 size, mtime, mode, year)
+
+  # mtime None if unknown
+  def make_description(self, fname, isdir, size, mtime, mode, year):
+    if mode == _LIST_NAMES:
+      return fname + "\r\n"
+    if mode == _LIST_MLSD:
+      if mtime is None:
+        modify = ""
       else:
-        description = "{} 1 owner group {:>10} {} {:2} {:02}:{:02} {}\r\n".\
-          format(file_permissions, file_size,
-                 _month_name[tm[1]], tm[2], tm[3], tm[4], fname)
-    else:
-      description = fname + "\r\n"
-    return description
-
-  def send_file_data(self, path, data_client):
+        modify = "modify={:04}{:02}{:02}{:02}{:02}{:02};".format(
+                 *localtime(mtime)[:6])
+      return "type={};size={};{} {}\r\n".format(
+             "dir" if isdir else "file", size, modify, fname)
+    tm = localtime(mtime or 0)
+    if tm[0] != year:
+      return "{} 1 owner group {:>10} {} {:2} {:>5} {}\r\n".\
+        format("drwxr-xr-x" if isdir else "-rw-r--r--", size,
+               _month_name[tm[1]], tm[2], tm[0], fname)
+    return "{} 1 owner group {:>10} {} {:2} {:02}:{:02} {}\r\n".\
+      format("drwxr-xr-x" if isdir else "-rw-r--r--", size,
+             _month_name[tm[1]], tm[2], tm[3], tm[4], fname)
+
+  def send_file_data(self, path, data_client, offset=0):
     with open(path,"rb") as file:
+      if offset:
+        file.seek(offset)
       chunk = file.read(_CHUNK_SIZE)
       while len(chunk) > 0:
         data_client.sendall(chunk)
         chunk = file.read(_CHUNK_SIZE)
       data_client.close()
 
-  def save_file_data(self, path, data_client, mode):
+  def save_file_data(self, path, data_client, mode, offset=0):
     with open(path, mode) as file:
+      if offset:
+        file.seek(offset)
       chunk = data_client.recv(_CHUNK_SIZE)
       while len(chunk) > 0:
         file.write(chunk)
@@ -152,30 +211,16 @@ class FTP_client:
     return ('/' if head == '' else head, tail)
 
   # compare fname against pattern. Pattern may contain
-  # the wildcards ? and *.
+  # the wildcards ? and *. Compiled patterns are cached
+  # per session, listing calls this for every file name.
   def fncmp(self, fname, pattern):
-    pi = 0
-    si = 0
-    while pi < len(pattern) and si < len(fname):
-      if (fname[si] == pattern[pi]) or (pattern[pi] == '?'):
-        si += 1
-        pi += 1
-      else:
-        if pattern[pi] == '*':  # recurse
-          if pi == len(pattern.rstrip("*?")):  # only wildcards left
-            return True
-          while si < len(fname):
-            if self.fncmp(fname[si:], pattern[pi + 1:]):
-              return True
-            else:
-              si += 1
-          return False
-        else:
-          return False
-    if pi == len(pattern.rstrip("*")) and si == len(fname):
-      return True
-    else:
-      return False
+    compiled = self.patterns.get(pattern)
+    if compiled is None:
+      if len(self.patterns) >= _PATTERN_CACHE:
+        self.patterns.clear()
+      compiled = fncompile(pattern)
+      self.patterns[pattern] = compiled
+    return fnmatch(fname, compiled)
 
   def open_dataclient(self):
     if self.active:  # active mode
@@ -247,6 +292,9 @@ class FTP_client:
       payload = data[len(command):].lstrip()  # partition is missing
       path = self.get_absolute_path(self.cwd, payload)
       log_msg(1, "Command={}, Payload={}".format(command, payload))
+      # REST offset applies only to the command that follows it
+      rest = self.rest
+      self.rest = 0
 
       if command == "USER":
         # self.logged_in = True
@@ -264,6 +312,21 @@ class FTP_client:
         cl.sendall("215 UNIX Type: L8\r\n")
       elif command in ("TYPE", "NOOP", "ABOR"):  # just accept & ignore
         cl.sendall('200 OK\r\n')
+      elif command == "FEAT":
+        cl.sendall("211-Features:\r\n"
+                   " SIZE\r\n"
+                   " REST STREAM\r\n"
+                   " MLST type*;size*;modify*;\r\n"
+                   "211 End\r\n")
+      elif command == "REST":
+        try:
+          self.rest = int(payload)
+          if self.rest < 0:
+            raise ValueError
+          cl.sendall('350 Restarting at {}\r\n'.format(self.rest))
+        except:
+          self.rest = 0
+          cl.sendall('501 Fail\r\n')
       elif command == "QUIT":
         cl.sendall('221 Bye.\r\n')
         close_client(cl)
@@ -295,7 +358,7 @@ class FTP_client:
           self.active = True
         else:
             cl.sendall('504 Fail\r\n')
-      elif command == "LIST" or command == "NLST":
+      elif command in ("LIST", "NLST", "MLSD"):
         if payload.startswith("-"):
           option = payload.split()[0].lower()
           path = self.get_absolute_path(
@@ -305,8 +368,13 @@ class FTP_client:
         try:
           data_client = self.open_dataclient()
           cl.sendall("150 Directory listing:\r\n")
-          self.send_list_data(path, data_client,
-                              command == "LIST" or 'l' in option)
+          if command == "MLSD":
+            mode = _LIST_MLSD
+          elif command == "LIST" or 'l' in option:
+            mode = _LIST_LONG
+          else:
+            mode = _LIST_NAMES
+          self.send_list_data(path, data_client, mode)
           cl.sendall("226 Done.\r\n")
           data_client.close()
         except:
@@ -315,13 +383,24 @@ class FTP_client:
             data_client.close()
       elif command == "RETR":
         try:
+          sink, arg = self.vpath(path)
           data_client = self.open_dataclient()
           cl.sendall("150 Opened data connection.\r\n")
-          self.send_file_data(path, data_client)
+          if sink:
+            sink.open(arg, rest)
+            result = sink.read_stream(data_client)
+            data_client.close()
+          else:
+            self.send_file_data(path, data_client, rest)
+            result = True
           # if the next statement is reached,
           # the data_client was closed.
           data_client = None
-          cl.sendall("226 Done.\r\n")
+          if result:
+            cl.sendall("226 Done.\r\n")
+          else:
+            cl.sendall('550 Fail\r\n')
+          del sink, arg, result
         except:
           cl.sendall('550 Fail\r\n')
           if data_client is not None:
@@ -331,31 +410,55 @@ class FTP_client:
         try:
           data_client = self.open_dataclient()
           cl.sendall("150 Opened data connection.\r\n")
-          if path == "/fpga":
-            import ecp5
-            ecp5.prog_stream(data_client,_CHUNK_SIZE)
-            result = ecp5.prog_close()
-            data_client.close()
-          elif path.startswith("/flash@"):
-            import ecp5
-            dummy, addr = path.split("@")
-            addr = int(addr)
-            result = ecp5.flash_stream(data_client,addr)
-            ecp5.flash_close()
-            del addr, dummy
-            data_client.close()
-          elif path.startswith("/sd@"):
-            import sdraw
-            dummy, addr = path.split("@")
-            addr = int(addr)
-            sd_raw = sdraw.sdraw()
-            result = sd_raw.sd_write_stream(data_client,addr)
-            del sd_raw, addr, dummy
+          sink, arg = self.vpath(path)
+          if sink:
+            # "/fpga.gz", "/flash.gz@addr" or gzip magic in data
+            gz = path.split("@")[0].endswith(".gz")
+            if gz and rest:  # can't resume inside of gzip stream
+              raise ValueError
+            sink.open(arg, rest)
+            stream = data_stream(data_client)
+            src = stream
+            try:
+              if not rest:
+                magic = bytearray(2)
+                n = stream.readinto(magic)
+                if n == 2 and magic == b"\x1f\x8b":
+                  # uzlib reads its source byte by byte, so
+                  # give it the socket, not python data_stream
+                  from gzhdr import gzip_header
+                  gzip_header(data_client)
+                  import uzlib
+                  src = uzlib.DecompIO(data_client, -15)
+                elif gz:  # ".gz" name but not gzip data
+                  raise ValueError
+                else:
+                  stream.unread(magic[:n])
+                del magic, n
+              gz = src is not stream
+              result = sink.write_stream(src)
+            finally:
+              # socket error or bad deflate data: still
+              # take FPGA out of programming or FLASH mode
+              result = sink.close() and result
+            del src
+            # remember how much was committed, so that an
+            # interrupted transfer can be resumed with SIZE and REST
+            if gz or not (result or stream.error):
+              committed.pop(path, None)
+            else:
+              committed[path] = rest+stream.count
+            result = result and not stream.error
+            del stream
             data_client.close()
+          elif rest and command == "STOR":
+            self.save_file_data(path, data_client, "r+b", rest)
+            result = True
           else:
             self.save_file_data(path, data_client,
                                 "w" if command == "STOR" else "a")
             result = True
+          del sink, arg
           # if the next statement is reached,
           # the data_client was closed.
           data_client = None
@@ -369,7 +472,32 @@ class FTP_client:
         del result
       elif command == "SIZE":
         try:
-          cl.sendall('213 {}\r\n'.format(uos.stat(path)[6]))
+          sink, arg = self.vpath(path)
+          if sink:
+            size = sink.stat(path, arg)
+            if size is None:
+              raise ValueError
+          else:
+            size = uos.stat(path)[6]
+          cl.sendall('213 {}\r\n'.format(size))
+          del sink, arg, size
+        except:
+          cl.sendall('550 Fail\r\n')
+      elif command == "MLST":
+        try:
+          sink, arg = self.vpath(path)
+          if sink:
+            size = sink.stat(path, arg)
+            description = self.make_description(path, False,
+              0 if size is None else size, None, _LIST_MLSD, 0)
+          else:
+            stat = uos.stat(path)
+            description = self.make_description(path,
+              (stat[0] & 0o170000) == 0o040000, stat[6], stat[7],
+              _LIST_MLSD, 0)
+          cl.sendall("250-Listing {}\r\n {}250 End\r\n".format(
+                     payload, description))
+          del sink, arg, description
         except:
           cl.sendall('550 Fail\r\n')
       elif command == "STAT":
@@ -383,7 +511,7 @@ class FTP_client:
                       _COMMAND_TIMEOUT, len(client_list)))
         else:
           cl.sendall("213-Directory listing:\r\n")
-          self.send_list_data(path, cl, True)
+          self.send_list_data(path, cl, _LIST_LONG)
           cl.sendall("213 Done.\r\n")
       elif command == "DELE":
         try:
@@ -433,12 +561,11 @@ class FTP_client:
           else:
             cl.sendall('550 Fail\r\n')
         elif path == "/passthru":
-          import ecp5
-          ecp5.passthru()
+          driver("ecp5").passthru()
           cl.sendall('250 OK passthru\r\n')
         elif path.endswith(".bit") or path.endswith(".bit.gz"):
           try:
-            import ecp5
+            ecp5 = driver("ecp5")
             if ecp5.prog(path, close=False):
               if path.startswith("/sd/"):
                 try:
@@ -476,6 +603,303 @@ class FTP_client:
     # tidy up before leaving
     client_busy = False
 
+# data connection reader for STOR to devices.
+# unread() bytes are delivered before socket data, buffers are
+# filled completely, and a broken connection is reported as EOF
+# so the device is closed properly and the received bytes
+# can be counted for resume.
+class data_stream:
+
+  def __init__(self, sock):
+    self.sock = sock
+    self.head = b""
+    self.count = 0  # bytes received from socket
+    self.error = False
+
+  def unread(self, buf):
+    self.head = buf + self.head
+
+  def readinto(self, buf):
+    mv = memoryview(buf)
+    n = len(self.head)
+    if n:
+      n = min(n, len(buf))
+      mv[:n] = self.head[:n]
+      self.head = self.head[n:]
+    try:
+      m = self.sock.readinto(mv[n:])
+    except OSError:
+      self.error = True
+      return 0
+    self.count += m
+    return n+m
+
+# collects small writes and sends them in few large sendall()
+class send_buffer:
+
+  def __init__(self, size):
+    self.buf = bytearray(size)
+    self.mv = memoryview(self.buf)
+    self.n = 0
+    self.sock = None
+
+  def write(self, s):
+    b = s.encode()
+    if self.n+len(b) > len(self.buf):
+      self.flush()
+      if len(b) > len(self.buf):
+        self.sock.sendall(b)
+        return
+    self.mv[self.n:self.n+len(b)] = b
+    self.n += len(b)
+
+  def flush(self):
+    if self.n:
+      self.sock.sendall(self.mv[:self.n])
+      self.n = 0
+
+# modules used by virtual paths, imported on first use
+_drivers = {}
+
+def driver(name):
+  module = _drivers.get(name)
+  if module is None:
+    module = __import__(name)
+    _drivers[name] = module
+  return module
+
+# decimal, or hex with "0x" prefix. Decimal may have
+# leading zeros, "0065536" is 65536
+def parse_int(s):
+  neg = s.startswith("-")
+  if neg:
+    s = s[1:]
+  if s[:2] in ("0x", "0X"):
+    n = int(s[2:], 16)
+  else:
+    n = int(s)
+  return -n if neg else n
+
+# "addr[:length]" after "@" of virtual path
+def parse_arg(arg):
+  if arg is None:
+    return 0, None
+  items = arg.split(":")
+  if len(items) > 1:
+    return parse_int(items[0]), parse_int(items[1])
+  return parse_int(items[0]), None
+
+# virtual path base class. STOR calls open(), write_stream() and
+# close() which finishes the device. RETR calls open() and
+# read_stream() which releases the device itself.
+# Register instances with register() to make them reachable from FTP.
+# Each FTP session works with its own copy, made by calling the
+# class without arguments, so addr and length are not shared.
+class vsink:
+  module = None  # driver module name
+
+  def drv(self):
+    return driver(self.module)
+
+  def open(self, arg, offset):
+    self.addr, self.length = parse_arg(arg)
+    self.addr += offset
+    if self.length is not None:
+      self.length -= offset
+
+  def write_stream(self, stream):
+    return False
+
+  def read_stream(self, data_client):
+    return False
+
+  def close(self):
+    return True
+
+  # size reported by SIZE and LIST, None if unknown
+  def stat(self, path, arg):
+    size = committed.get(path)
+    if size is None:
+      return parse_arg(arg)[1]
+    return size
+
+class fpga_sink(vsink):
+  module = "ecp5"
+
+  def open(self, arg, offset):
+    if offset:  # SRAM can't be resumed
+      raise ValueError
+    vsink.open(self, arg, offset)
+    self.streamed = False
+
+  def write_stream(self, stream):
+    # False: bitstream rejected before programming,
+    # exception: prog_stream() closed programming itself
+    self.streamed = self.drv().prog_stream(stream, _CHUNK_SIZE)
+    return self.streamed
+
+  def close(self):
+    return self.streamed and self.drv().prog_close()
+
+class flash_sink(vsink):
+  module = "ecp5"
+
+  def write_stream(self, stream):
+    ecp5 = self.drv()
+    addr = self.addr
+    # resume inside of erase block: prepend what flash already has
+    head = bytearray(addr & (ecp5.flash_erase_size-1))
+    if len(head):
+      addr -= len(head)
+      ecp5.flash_read(head, addr)
+      stream.unread(head)
+    return ecp5.flash_stream(stream, addr)
+
+  def read_stream(self, data_client):
+    if self.length is None:
+      return False
+    ecp5 = self.drv()
+    block = bytearray(ecp5.flash_read_size)
+    blockmv = memoryview(block)
+    addr = self.addr
+    end = addr+self.length
+    ecp5.flash_open()
+    try:
+      while addr < end:
+        n = min(end-addr, len(block))
+        ecp5.flash_read_block(blockmv[:n], addr)
+        data_client.sendall(blockmv[:n])
+        addr += n
+    finally:
+      ecp5.flash_close()
+    return True
+
+  def close(self):
+    self.drv().flash_close()
+    return True
+
+class sd_sink(vsink):
+  module = "sdraw"
+
+  def open(self, arg, offset):
+    vsink.open(self, arg, offset)
+    if self.addr-offset < 0 and self.addr >= 0:  # would wrap to start of card
+      raise ValueError
+
+  def write_stream(self, stream):
+    sd_raw = self.drv().sdraw()
+    addr = self.addr
+    # resume inside of sector: prepend what SD already has
+    head = addr & 0x1FF
+    if head:
+      addr -= head
+      sector = bytearray(0x200)
+      sd_raw.sd_read(sector, addr)
+      stream.unread(sector[:head])
+      del sector
+    # small blocks: FTP server and its buffers stay in RAM
+    return sd_raw.sd_write_stream(stream, addr, blocksize=4096)
+
+  def read_stream(self, data_client):
+    if self.length is None:
+      return False
+    sd_raw = self.drv().sdraw()
+    block = bytearray(4096)
+    blockmv = memoryview(block)
+    # read whole sectors, skip head of the first one
+    skip = self.addr & 0x1FF
+    sd_raw.sd_open()
+    addr = sd_raw.sd_wrapaddr(self.addr-skip)
+    end = addr+skip+self.length
+    try:
+      while addr < end:
+        n = min((end-addr+0x1FF) & ~0x1FF, len(block))
+        sd_raw.sd.readblocks(addr//0x200, blockmv[:n])
+        data_client.sendall(blockmv[skip:min(n, end-addr)])
+        skip = 0
+        addr += n
+    finally:
+      sd_raw.sd_close()
+    return True
+
+# path: bytes committed by interrupted STOR to a virtual path.
+# Not per session: client reconnecting after WiFi loss asks
+# SIZE in a new session, then resumes with REST
+committed = {}
+
+# virtual paths are "/name" or "/name@arg"
+# name including "@" is registered, e.g. register("/flash@", flash_sink())
+sinks = {}
+
+def register(name, sink):
+  sinks[name] = sink
+  # "/fpga.gz", "/flash.gz@" for gzip compressed data
+  if name.endswith("@"):
+    sinks[name[:-1]+".gz@"] = sink
+  else:
+    sinks[name+".gz"] = sink
+
+# returns (sink, arg) or (None, None) for normal files
+def vpath(path):
+  at = path.find("@")
+  if at < 0:
+    return sinks.get(path), None
+  return sinks.get(path[:at+1]), path[at+1:]
+
+register("/fpga", fpga_sink())
+register("/flash@", flash_sink())
+register("/sd@", sd_sink())
+
+# compile wildcard pattern for fnmatch().
+# runs of "*" are collapsed into one "*". Returns (wild, pattern)
+# where wild is 0 for plain name, 1 for "*" only, 2 otherwise
+def fncompile(pattern):
+  if "*" not in pattern and "?" not in pattern:
+    return 0, pattern
+  while "**" in pattern:
+    pattern = pattern.replace("**", "*")
+  if pattern == "*":
+    return 1, pattern
+  return 2, pattern
+
+# match fname against compiled pattern without recursion or
+# slicing: on mismatch, only the last "*" is retried, one
+# character further. Time is O(len(fname)*len(pattern))
+# worst case and linear for usual patterns.
+def fnmatch(fname, compiled):
+  wild, pattern = compiled
+  if wild == 0:
+    return fname == pattern
+  if wild == 1:
+    return True
+  lf = len(fname)
+  lp = len(pattern)
+  si = 0
+  pi = 0
+  star = -1  # pattern index of last "*"
+  mark = 0  # fname index matched by last "*"
+  while si < lf:
+    if pi < lp:
+      c = pattern[pi]
+      if c == "*":
+        star = pi
+        pi += 1
+        mark = si
+        continue
+      if c == "?" or c == fname[si]:
+        si += 1
+        pi += 1
+        continue
+    if star < 0:
+      return False
+    # let last "*" eat one more character
+    pi = star+1
+    mark += 1
+    si = mark
+  while pi < lp and pattern[pi] == "*":
+    pi += 1
+  return pi == lp
+
 def log_msg(level, *args):
   global verbose_l
   if verbose_l >= level:
@@ -531,7 +955,6 @@ def start(port=21, verbose=0, splash=True):
   global verbose_l
   global client_list
   global client_busy
-  global AP_addr, STA_addr
 
   alloc_emergency_exception_buf(100)
   verbose_l = verbose
@@ -553,6 +976,12 @@ def start(port=21, verbose=0, splash=True):
   datasocket.settimeout(10)
   ftpsocket.setsockopt(socket.SOL_SOCKET, _SO_REGISTER_HANDLER, accept_ftp_connect)
 
+  update_addr(port, splash)
+
+# interface addresses for PASV replies, call again
+# when interface gets address after start()
+def update_addr(port=21, splash=True):
+  global AP_addr, STA_addr
   wlan = network.WLAN(network.AP_IF)
   if wlan.active():
     ifconfig = wlan.ifconfig()
@@ -0,0 +1,182 @@
+# micropython ESP32
+# local cache of web files
+
+# LICENSE=BSD
+
+# files are kept on SD card (or ESP32 FLASH if SD is not mounted),
+# named by content hash so URLs with the same content share a file.
+# Each use asks the server with If-None-Match/If-Modified-Since and
+# downloads only if the file changed. Least recently used files are
+# removed to keep total size under "budget".
+# usage:
+# import webcache
+# f = webcache.open_url("http://192.168.4.2/blink.bit")
+# webcache.info()
+
+import uos
+import ujson
+import uhashlib
+from ubinascii import hexlify
+import httpclient
+
+budget = 4*1024*1024 # bytes of cached files
+cache_dir = None # None: "/sd/webcache" if SD is mounted, else "/webcache"
+
+def directory():
+  d = cache_dir
+  if d is None:
+    try:
+      uos.stat("/sd")
+      d = "/sd/webcache"
+    except OSError:
+      d = "/webcache"
+  try:
+    uos.mkdir(d)
+  except OSError:
+    pass
+  return d
+
+# index: {"seq": use counter, "urls": {url: [etag, lastmod, key, size, use]}}
+def load(d):
+  try:
+    with open(d + "/index.json") as f:
+      return ujson.load(f)
+  except (OSError, ValueError):
+    return {"seq": 0, "urls": {}}
+
+def save(d, idx):
+  with open(d + "/index.json", "w") as f:
+    ujson.dump(idx, f)
+
+def exists(path):
+  try:
+    uos.stat(path)
+    return True
+  except OSError:
+    return False
+
+def open_file(filename, gz=False):
+  filedata = open(filename, "rb")
+  if gz:
+    import uzlib
+    return uzlib.DecompIO(filedata,31)
+  return filedata
+
+# remove url from index, and its file if no other url uses it
+# returns freed bytes
+def drop(d, idx, url):
+  urls = idx["urls"]
+  key, size = urls.pop(url)[2:4]
+  for ent in urls.values():
+    if ent[2] == key:
+      return 0
+  try:
+    uos.remove(d + "/" + key)
+  except OSError:
+    pass
+  return size
+
+# remove least recently used entries until size more bytes fit
+def evict(d, idx, size):
+  urls = idx["urls"]
+  files = {}
+  for ent in urls.values():
+    files[ent[2]] = ent[3]
+  total = sum(files.values())
+  while total + size > budget and urls:
+    total -= drop(d, idx, min(urls, key=lambda u: urls[u][4]))
+
+# download response body into cache, returns key
+def store(d, idx, url, r):
+  h = uhashlib.sha256()
+  size = 0
+  block = bytearray(4096)
+  src = httpclient.resumable(url, r)
+  with open(d + "/tmp", "wb") as f:
+    while True:
+      n = src.readinto(block)
+      if not n:
+        break
+      mv = memoryview(block)[:n]
+      h.update(mv)
+      f.write(mv)
+      size += n
+  key = hexlify(h.digest()).decode()[:16]
+  if url in idx["urls"]: # old version
+    drop(d, idx, url)
+  evict(d, idx, size)
+  if exists(d + "/" + key): # same content from another url
+    uos.remove(d + "/tmp")
+  else:
+    uos.rename(d + "/tmp", d + "/" + key)
+  idx["urls"][url] = [r.headers.get("etag"), r.headers.get("last-modified"), key, size, 0]
+  print("cached %d bytes %s" % (size, key))
+  return key
+
+# bring url up to date in cache
+# returns cached filename, named by content hash, or None if not found
+def fetch(url):
+  d = directory()
+  idx = load(d)
+  ent = idx["urls"].get(url)
+  if ent and not exists(d + "/" + ent[2]):
+    ent = None
+  extra = ""
+  if ent:
+    if ent[0]:
+      extra += "If-None-Match: %s\r\n" % ent[0]
+    if ent[1]:
+      extra += "If-Modified-Since: %s\r\n" % ent[1]
+  try:
+    r = httpclient.get(url, extra)
+  except OSError as e:
+    if not ent:
+      raise
+    print("%s, using cache" % e)
+    r = None
+  if r and r.status == 304:
+    r.close()
+    r = None
+  if r:
+    if r.status != 200:
+      print("HTTP %d %s" % (r.status, url))
+      r.close()
+      return None
+    key = store(d, idx, url, r)
+  else:
+    key = ent[2]
+    print("from cache %s" % key)
+  idx["seq"] += 1
+  idx["urls"][url][4] = idx["seq"]
+  save(d, idx)
+  return d + "/" + key
+
+# cached filename of url without asking the server,
+# None if not cached. For boot before network is up
+def cached(url):
+  d = directory()
+  ent = load(d)["urls"].get(url)
+  if ent and exists(d + "/" + ent[2]):
+    return d + "/" + ent[2]
+  return None
+
+# open url through cache, like httpclient.open_url()
+# returns stream or None if not found
+def open_url(url, gz=False):
+  filename = fetch(url)
+  if filename:
+    return open_file(filename, gz)
+
+def info():
+  d = directory()
+  idx = load(d)
+  total = 0
+  for url, ent in idx["urls"].items():
+    print("%s %8d %s" % (ent[2], ent[3], url))
+    total += ent[3]
+  print("%d bytes in %s, budget %d" % (total, d, budget))
+
+def clear():
+  d = directory()
+  for name in uos.listdir(d):
+    uos.remove(d + "/" + name)
@@ -1,5 +1,10 @@
 import network
 import time
+from ubinascii import hexlify, unhexlify
+
+# last successful network, tried first without scan
+last_file = "wifiman.last"
+connect_ms = None # time to IP of last get_connection()
 
 def read_profiles():
     with open("wifiman.conf") as f:
@@ -10,6 +15,21 @@ def read_profiles():
         profiles[ssid] = password
     return profiles
 
+def read_last():
+    try:
+        with open(last_file) as f:
+            ssid, bssid, channel = f.read().strip("\n").rsplit(":", 2)
+        return ssid, unhexlify(bssid), int(channel)
+    except (OSError, ValueError):
+        return None
+
+def write_last(ssid, bssid, channel):
+    try:
+        with open(last_file, "w") as f:
+            f.write("%s:%s:%d\n" % (ssid, hexlify(bssid).decode(), channel))
+    except OSError as e:
+        print("exception", str(e))
+
 wlan_sta = network.WLAN(network.STA_IF)
 
 def get_connection():
@@ -19,16 +39,26 @@ def get_connection():
     if wlan_sta.isconnected():
         return wlan_sta
 
+    start = time.ticks_ms()
     connected = False
     try:
-        # ESP connecting to WiFi takes time, wait a bit and try again:
-        time.sleep(3)
-        if wlan_sta.isconnected():
-            return wlan_sta
-
         # Read known network profiles from file
         profiles = read_profiles()
 
+        # Last network directly, scan only if it fails.
+        # bssid skips choosing AP, channel is only reported,
+        # micropython connect() has no channel parameter.
+        # Not in profiles means it was open network
+        last = read_last()
+        if last:
+            ssid, bssid, channel = last
+            print("ssid: %s chan: %d (last)" % (ssid, channel))
+            connected = do_connect(ssid, profiles.get(ssid), bssid, 50)
+            if not connected:
+                wlan_sta.disconnect()
+        if connected:
+            return connected_in(start)
+
         # Search WiFis in range
         wlan_sta.active(True)
         networks = wlan_sta.scan()
@@ -45,19 +75,29 @@ def get_connection():
             else:  # open
                 connected = do_connect(ssid, None)
             if connected:
-                break
+                write_last(ssid, bssid, channel)
+                return connected_in(start)
 
     except OSError as e:
         print("exception", str(e))
 
     return wlan_sta
 
-def do_connect(ssid, password):
+def connected_in(start):
+    global connect_ms
+    connect_ms = time.ticks_diff(time.ticks_ms(), start)
+    print("IP %s in %d ms" % (wlan_sta.ifconfig()[0], connect_ms))
+    return wlan_sta
+
+def do_connect(ssid, password, bssid=None, retries=100):
     wlan_sta.active(True)
     if wlan_sta.isconnected():
         return None
-    wlan_sta.connect(ssid, password)
-    for retry in range(100):
+    if bssid:
+        wlan_sta.connect(ssid, password, bssid=bssid)
+    else:
+        wlan_sta.connect(ssid, password)
+    for retry in range(retries):
         connected = wlan_sta.isconnected()
         if connected:
             break